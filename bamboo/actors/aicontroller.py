@@ -19,15 +19,9 @@ class AIController(object):
 	def choose_target(self):
 		"""Returns the nearest player character, or None
 		if there are no players in range"""
-		targets = self.character.level.find_playercharacters()
-		nearest, distance = None, None
-		for t in targets:
-			d = self.character.distance_to(t.pos)
-			if nearest is None or d < distance:
-				nearest = t
-				distance = d 
-		if distance < self.SLEEP_DISTANCE:
-			return nearest
+		from bamboo.actors.characters import Character
+		nearest, distance = self.character.level.nearest_actor(self.character.pos, Character, max_distance=self.SLEEP_DISTANCE, filter=lambda a: a.is_pc)
+		return nearest
 
 	def range_to(self, pos):
 		return (pos - self.character.pos).mag()
@@ -112,27 +106,20 @@ class AIController(object):
 			self.set_strategy('approach')
 
 	def pick_tree(self):
-		nearest = None
-		distance = None
+		from bamboo.actors.trees import Climbable
 		sx = self.character.pos.x
 		tx = self.target.pos.x
-		for a in self.character.level.get_climbables():
-			ax = a.pos.x
+
+		def usable(a):
+			if not a.is_climbable() or a.actors:
+				return False
 			if sx < tx - 100:
-				if a.pos.x > tx:
-					continue
+				return a.pos.x <= tx
 			elif sx > tx + 100:
-				if a.pos.x < tx:
-					continue
-			if a.actors:
-				continue
-				
-			d = abs(tx - ax)
-			if nearest is None or d < distance:
-				nearest = a
-				distance = d
-
-		return nearest, distance
+				return a.pos.x >= tx
+			return True
+
+		return self.character.level.nearest_actor(self.target.pos, Climbable, distance=lambda a: abs(tx - a.pos.x), filter=usable)
 
 	def strategy_climbtree(self):
 		"""Climb a tree near the player"""
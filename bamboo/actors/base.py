@@ -1,7 +1,7 @@
 import pyglet
 
 from bamboo.resources import ResourceTracker
-from bamboo.geom import Vec2
+from bamboo.geom import Vec2, Rect
 
 class Actor(ResourceTracker):
 	initial_animation = None
@@ -10,26 +10,39 @@ class Actor(ResourceTracker):
 	sprite = None
 
 	controller = None
-	collision_mask = 0x00
+	pool = None	# the ActorPool this actor is recycled by, if any
+	collision_mask = 0x00	# collision categories this actor belongs to
+	collides_with = 0x00	# categories this actor wants on_collide() calls for
 
 	level = None
 	rotation = 0
 	scale = 1.0
 	opacity = 255
 
+	CULL_RADIUS = 300	# the actor draws nothing further than this from its position
+
 	dir = 'r'
 
 	def _get_pos(self):
 		return self._pos
 	
 	def _set_pos(self, pos):
-		self._pos = pos
 		if self.level:
-			# TODO: tell level we've moved, so level can optimise
-			self._ground_level = self.level.ground.height_at(pos.x)
-			self._ground_normal = self.level.ground.normal_at(pos.x)
+			# Ground data is looked up lazily, or for many actors at once by
+			# prefetch_ground(). Look for ground from the higher of the old and
+			# new positions, so that fast-falling actors can't drop through a
+			# surface.
+			self._ground_y = max(pos.y, self._pos.y)
+			self._ground = None
+			self._pos = pos
+			self.level.actor_moved(self)
+		else:
+			self._pos = pos
 
 	_pos = Vec2(0, 0)
+	_prev_pos = None	# position before the last logic update, for drawing
+	_ground = None
+	_ground_y = None
 	pos = property(_get_pos, _set_pos)
 
 	def add_death_listener(self, callback):
@@ -56,23 +69,42 @@ class Actor(ResourceTracker):
 		self.fire_death_event()
 		self.level.kill(self)
 
+	def fall(self):
+		"""Called when the actor falls into the void beneath the terrain"""
+		self.die()
+
 	def distance_to(self, pos):
 		return (pos - self.pos).mag()
 
+	def index_bounds(self):
+		"""Return a Rect to index this actor by in the level's spatial index,
+		or None to index it by its position"""
+		return None
+
+	def cull_bounds(self):
+		"""Return a Rect outside of which this actor draws nothing, so that it
+		can be skipped when it is off screen"""
+		r = self.CULL_RADIUS
+		x, y = self._pos
+		return Rect(x - r, y - r, r * 2, r * 2)
+
+	def ground(self):
+		"""Return the height and normal of the ground beneath this actor"""
+		if self._ground is None:
+			self._ground = self.level.ground.ground_at(self._pos.x, self._ground_y)
+		return self._ground
+
 	def ground_level(self):
-		try:
-			return self._ground_level
-		except AttributeError:
-			self._ground_level = self.level.ground.height_at(self.pos.x)
-			return self._ground_level
+		return self.ground()[0]
 
 	def ground_normal(self):
-		try:
-			return self._ground_normal
-		except AttributeError:
-			self._ground_normal = self.level.ground.normal_at(self.pos.x)
-			return self._ground_normal
-			
+		return self.ground()[1]
+
+	@classmethod
+	def get_spawned_classes(cls):
+		"""Return the classes of actors that this class may spawn, so that
+		their resources can be loaded along with it."""
+		return []
 
 	def play_sound(self, name):
 		"""Play a named sound from the Actor's resources"""
@@ -90,27 +122,66 @@ class Actor(ResourceTracker):
 		if hasattr(self, 'layer'):
 			return pyglet.graphics.OrderedGroup(self.layer)
 
-	def update_batch(self, batch):
+	def save_state(self):
+		"""Record the current position to interpolate from when drawing"""
+		self._prev_pos = self._pos
+
+	def draw_pos(self, alpha=1.0):
+		"""Return the position to draw at, alpha of the way from the
+		position before the last logic update to the current one."""
+		p = self._prev_pos
+		if p is None or alpha >= 1.0:
+			return self._pos
+		return p + (self._pos - p) * alpha
+
+	def update_batch(self, batch, alpha=1.0):
+		pos = self.draw_pos(alpha)
 		if self.next is not None:
 			group = self.parent_group()
 			if not self.sprite:
-				self.sprite = pyglet.sprite.Sprite(self.graphics[self.next], self.pos.x, self.pos.y, batch=batch, group=group)
+				self.sprite = pyglet.sprite.Sprite(self.graphics[self.next], pos.x, pos.y, batch=batch, group=group)
 				self.sprite.opacity = self.opacity
 				self.sprite._scale = self.scale
 				self.sprite._update_position()
+				self.current = self.next
+				self.next = None
+				return
 			self.sprite.image = self.graphics[self.next]
 			self.current = self.next
 			self.next = None
-		elif self.sprite: 
+		if self.sprite:
 			# pyglet regenerates the position whenever any property is set
 			# accessing the internal properties directly, and then updating, is faster
 			self.sprite._rotation = self.rotation
-			self.sprite._x = self.pos.x
-			self.sprite._y = self.pos.y
+			self.sprite._x = pos.x
+			self.sprite._y = pos.y
 			self.sprite._scale = self.scale
 			self.sprite._update_position()
 			self.sprite.opacity = self.opacity
 
+	def show(self):
+		"""Show the sprite again after hide()"""
+		if self.sprite and not self.sprite.visible:
+			self.sprite.visible = True
+
+	def hide(self):
+		"""Hide the sprite while the actor is off screen"""
+		if self.sprite and self.sprite.visible:
+			self.sprite.visible = False
+
+	def reset(self, *args, **kwargs):
+		"""Reinitialise a dead actor so that it can be spawned again.
+
+		Everything but the sprite and pool is discarded, and the constructor
+		is called again with the given arguments.
+		"""
+		sprite = self.sprite
+		pool = self.pool
+		self.__dict__.clear()
+		self.sprite = sprite
+		self.pool = pool
+		self.__init__(*args, **kwargs)
+
 	def delete(self):
 		"""Remove from batch"""
 		if self.sprite:
@@ -120,6 +191,10 @@ class Actor(ResourceTracker):
 	def update(self):
 		"""Subclasses can implement this method if necessary to implement game logic"""
 
+	def on_collide(self, actor):
+		"""Called when this actor's bounds() intersect those of an actor in
+		one of the categories in collides_with"""
+
 	def on_spawn(self):
 		"""Subclasses can implement this method to initialise the actor"""
 		if self.initial_animation:
@@ -192,3 +267,14 @@ class PhysicalObject(Actor):
 
 		self.v = (self.v + accel) * (1 - self.LINEAR_DAMPING)
 		self.pos += self.v
+
+
+def prefetch_ground(actors, terrain):
+	"""Look up the ground beneath every PhysicalObject in actors whose ground
+	data is out of date, in a single batch query to the terrain."""
+	stale = [a for a in actors if a._ground is None and isinstance(a, PhysicalObject)]
+	if not stale:
+		return
+	grounds = terrain.grounds_at([a._pos.x for a in stale], [a._ground_y for a in stale])
+	for a, g in zip(stale, grounds):
+		a._ground = g
@@ -4,7 +4,6 @@ import random
 from base import PhysicalObject, Actor
 from bamboo.geom import Vec2, Rect
 
-from bamboo.actors.particles import Smoke
 from bamboo.actors.gibs import BloodSpray
 from bamboo.actors.projectiles import Shuriken
 
@@ -28,6 +27,7 @@ class Character(PhysicalObject):
 	is_pc = False	# True if this character is a player character
 
 	collision_mask = 0x01
+	collides_with = 0x01
 
 	layer = 5
 
@@ -49,6 +49,10 @@ class Character(PhysicalObject):
 
 		self.trail = []
 
+	@classmethod
+	def get_spawned_classes(cls):
+		return [cls.CORPSE, BloodSpray, Shuriken]
+
 	def run_speed(self):
 		return max(self.MAX_RUN_SPEED - self.v.mag(), 0) * self.GROUND_ACCEL
 
@@ -92,9 +96,8 @@ class Character(PhysicalObject):
 	def nearby_climbable(self):
 		"""Returns the nearest climbable, or None if there is none
 		in "range"."""
-		tree, distance = self.level.get_nearest_climbable(self.pos)
-		if tree and distance < 30:
-			return tree
+		tree, distance = self.level.get_nearest_climbable(self.pos, max_distance=30)
+		return tree
 
 	def climb_up(self):
 		assert self.is_climbing()
@@ -165,8 +168,7 @@ class Character(PhysicalObject):
 
 		if self.is_on_ground() and self.crouching and abs(self.v.x) > 2:
 			if random.randint(0, 3) == 0:
-				s = Smoke(dir='r' if self.dir == 'l' else 'l')
-				self.level.spawn(s, x=self.pos.x)
+				self.level.smoke.puff(self.pos.x, self.ground_level(), dir='r' if self.dir == 'l' else 'l')
 		self.update_animation()
 
 	def draw_trail(self):
@@ -267,6 +269,14 @@ class Character(PhysicalObject):
 			w, h = self.dims()
 			return Rect(self.pos.x - w / 2, self.pos.y, w, h)
 
+	def on_collide(self, actor):
+		if isinstance(actor, Character):
+			# push characters apart
+			ab = actor.pos - self.pos
+			if not ab:
+				ab = Vec2(0, 1)
+			self.pos -= ab.normalized()
+
 	def create_corpse(self):
 		corpse = self.CORPSE(self)
 		self.level.spawn(corpse, x=self.pos.x, y=self.pos.y)
@@ -275,7 +285,7 @@ class Character(PhysicalObject):
 	def hit(self, point, force, damage=10):
 		for s in range(4):
 			off = Vec2(random.random() * 20 - 10, random.random() * 10 - 5) 
-			self.level.spawn(BloodSpray(v=force + off), x=point.x, y=point.y)
+			self.level.spawn_pooled(BloodSpray, point.x, point.y, v=force + off, source=self)
 		if not self.is_climbing():
 			self.apply_impulse(force / self.MASS)
 		self.health -= damage
@@ -298,6 +308,11 @@ class Character(PhysicalObject):
 	def on_death(self):
 		pass
 
+	def fall(self):
+		# There's nothing down there to leave a corpse on
+		self.on_death()
+		self.die()
+
 	def draw(self):
 		if self.TRAIL_LENGTH:
 			self.draw_trail()
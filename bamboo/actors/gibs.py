@@ -1,15 +1,21 @@
 import random
 from bamboo.actors.base import PhysicalObject
+from bamboo.geom import Rect
 
 
 class BloodSpray(PhysicalObject):
 	initial_animation = 'spray'
 	MASS = 0.2
+	POOL_SIZE = 80	# most sprays alive at once
 
-	def __init__(self, v):
+	collision_mask = 0x04
+	collides_with = 0x01
+
+	def __init__(self, v, source=None):
 		super(BloodSpray, self).__init__()
 		self.v = v
 		self.dir = 'r' if v.x > 0 else 'l'
+		self.source = source	# the character that is bleeding
 	
 	def on_spawn(self):
 		anim = random.choice(['spray-1', 'spray-2', 'spray-3']) 
@@ -21,6 +27,14 @@ class BloodSpray(PhysicalObject):
 		cls.load_directional_sprite('spray-2', 'blood-spray-2.png', anchor_x=0, anchor_y='center')
 		cls.load_directional_sprite('spray-3', 'blood-spray-3.png', anchor_x=0, anchor_y='center')
 
+	def bounds(self):
+		return Rect.from_center(self.pos, 10, 10)
+
+	def on_collide(self, actor):
+		"""Blood that splashes onto another character is absorbed"""
+		if actor is not self.source:
+			self.level.kill(self)
+
 	def update(self):
 		if self.is_on_ground():
 			self.level.kill(self)
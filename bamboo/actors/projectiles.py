@@ -1,10 +1,16 @@
 from bamboo.actors.base import PhysicalObject
+from bamboo.geom import Rect
 
 class Shuriken(PhysicalObject):
 	MASS = 0.1
 
 	layer = 3
 
+	collision_mask = 0x02
+	collides_with = 0x01
+
+	DAMAGE = 10
+
 	def __init__(self, v, owner):
 		super(Shuriken, self).__init__()
 		self.owner = owner
@@ -19,11 +25,17 @@ class Shuriken(PhysicalObject):
 	def on_class_load(cls):
 		cls.load_sprite('shuriken', 'shuriken.png', anchor_x='center', anchor_y='center')
 
+	def bounds(self):
+		return Rect.from_center(self.pos, 20, 20)
+
 	def on_collide(self, actor):
-		if actor == self.owner:
+		from bamboo.actors.characters import Character
+		if actor == self.owner or not self.v:
 			return
 		elif isinstance(actor, Character):
-			actor.hit(self.v * self.MASS, 10)
+			actor.hit(self.pos, self.v * self.MASS, self.DAMAGE)
+			if self.level:
+				self.level.kill(self)
 
 	def update(self):
 		if self.rest_time >= 100:
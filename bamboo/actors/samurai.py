@@ -14,8 +14,8 @@ class SamuraiCorpse(Corpse):
 		cls.load_directional_sprite('dying', 'samurai-dying.png', anchor_x=125)
 		cls.load_directional_sprite('dead', 'samurai-dead.png', anchor_x=160, anchor_y=15)
 
-	def update_batch(self, batch):
-		super(SamuraiCorpse, self).update_batch(batch)
+	def update_batch(self, batch, alpha=1.0):
+		super(SamuraiCorpse, self).update_batch(batch, alpha)
 		if self.col and self.sprite:
 			self.sprite.color = self.col
 
@@ -28,8 +28,8 @@ class Samurai(Character):
 		super(Samurai, self).__init__()
 		self.col = col
 
-	def update_batch(self, batch):
-		super(Samurai, self).update_batch(batch)
+	def update_batch(self, batch, alpha=1.0):
+		super(Samurai, self).update_batch(batch, alpha)
 		if self.col and self.sprite:
 			self.sprite.color = self.col
 	
@@ -6,6 +6,7 @@ from base import Actor
 class Torii(Actor):
 	initial_animation = 'torii'
 	layer = 0
+	CULL_RADIUS = 400
 	@classmethod
 	def on_class_load(cls):
 		cls.load_sprite('torii', 'torii.png')
@@ -29,9 +30,6 @@ class Campfire(Actor):
 		cls.load_animation('campfire', 'campfire%d.png', 4)
 
 	def update(self):
-		from bamboo.actors.particles import Smoke
 		if random.randint(0, 10) == 0:
 			v = Vec2(random.random() * 2 - 1, random.random() * 2) 
-			s = Smoke(v)
-			s.scale = 0.1
-			self.level.spawn(s, x=self.pos.x + random.random() * 20 - 10, y=self.pos.y + 40)
+			self.level.smoke.puff(self.pos.x + random.random() * 20 - 10, self.pos.y + 40, v, scale=0.1)
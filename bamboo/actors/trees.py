@@ -1,12 +1,14 @@
 import math
 import random
+from array import array
+from bisect import bisect_left, bisect_right
 
 import pyglet
 from pyglet.gl import *
 
 from base import Actor
 
-from bamboo.geom import Vec2, Matrix2, Rect
+from bamboo.geom import Vec2, Rect
 
 
 class Climbable(object):
@@ -50,6 +52,9 @@ class BambooTree(Actor, Climbable):
 	TEX_PERIOD = 1.5
 	THINNING = 0.96 ** TEX_PERIOD		# trees get thinner as you go up, by this ratio per segment
 
+	swaying = False		# True if the tree is animated by a shader
+	hidden = False		# True while the tree's vertex lists are out of its batch
+
 	def __init__(self, x=60, height=9, angle=0):
 		Climbable.__init__(self)
 		self.height = height
@@ -58,48 +63,79 @@ class BambooTree(Actor, Climbable):
 		self.wobble_angle = 0
 		self.wind_phase = 0
 		self.batch = None
+		self.nodes = None
+		self.nodes_angle = None
+		self.hidden_batch = None
 
 	def on_spawn(self):
 		self.wind_phase = 0.1 * self.pos.x
 
-	def distance_from(self, p):
-		"""Estimate the distance from x, y to this tree. This only works for small wobbly angles."""
-		da = self.wobble_angle / self.height
+	def compute_nodes(self):
+		"""Compute the positions of the joints between segments, and the
+		direction of each segment, for the current wobble angle.
 
-		rotation = Matrix2.rotation(da)
-		pos = self.pos
-		step = Vec2(0, self.PIECE_HEIGHT).rotate(self.base_angle)
-		radius = Vec2(self.RADIUS, 0).rotate(self.base_angle)
+		There are height + 2 nodes, from the base to one segment beyond the
+		top; cos and sin give the direction of the segment starting at each
+		node (rotated from vertical), and widths the radius of the trunk.
 
-		if pos.y > p.y:
-			return (p - pos).mag()
+		"""
+		da = self.wobble_angle / self.height
+		cd = math.cos(da)
+		sd = math.sin(da)
+		c = math.cos(self.base_angle)
+		s = math.sin(self.base_angle)
+		x = self.pos.x
+		y = self.pos.y
+		xs = array('d', [x])
+		ys = array('d', [y])
+		cs = array('d')
+		ss = array('d')
+		widths = array('d')
+		w = self.RADIUS
+		rising = self.height + 1
+		for i in xrange(self.height + 1):
+			cs.append(c)
+			ss.append(s)
+			widths.append(w)
+			if c <= 0 and rising > i:
+				rising = i
+			x -= s * self.PIECE_HEIGHT
+			y += c * self.PIECE_HEIGHT
+			xs.append(x)
+			ys.append(y)
+			c, s = c * cd - s * sd, s * cd + c * sd
+			w *= self.THINNING
+		self.nodes = (xs, ys, cs, ss, widths)
+		self.nodes_rising = rising	# segments before this one go upwards
+		self.nodes_angle = self.wobble_angle
+
+	def get_nodes(self):
+		"""Return the cached nodes, recomputing them if the tree has moved.
+
+		Returns a tuple of arrays (xs, ys, cos, sin, widths).
+		"""
+		if self.nodes is None or self.nodes_angle != self.wobble_angle:
+			self.compute_nodes()
+		return self.nodes
 
-		for i in range(self.height + 1):
-			if pos.y > p.y:
-				return abs(pos.x - p.x)
-			pos += step
-			step = rotation * step
-		
-		return (p - pos).mag()
+	def distance_from(self, p):
+		"""Estimate the distance from x, y to this tree. This only works for small wobbly angles."""
+		xs, ys = self.get_nodes()[:2]
+		# the first node above p, up to the top of the tree
+		i = bisect_right(ys, p.y)
+		if i == 0 or i > self.height:
+			i = min(i, self.height + 1)
+			return (p - Vec2(xs[i], ys[i])).mag()
+		return abs(xs[i] - p.x)
 
 	def height_for_y(self, y):
 		"""Estimate the height in this tree for a coordinate of y. This only works for small wobble angles."""
-		da = self.wobble_angle / self.height
-
-		rotation = Matrix2.rotation(da)
-		pos = self.pos
-		step = Vec2(0, self.PIECE_HEIGHT).rotate(self.base_angle)
-		radius = Vec2(self.RADIUS, 0).rotate(self.base_angle)
-
-		for i in range(self.height + 1):
-			if step.y <= 0:
-				raise ValueError("Tree does not reach a height of %f." % y)
-			next = pos + step
-			if next.y >= y:
-				return i + float(y - pos.y) / step.y
-			pos += step
-			step = rotation * step
-		raise ValueError("Tree does not reach a height of %f." % y)
+		ys = self.get_nodes()[1]
+		# the first node above y ends the segment that y is in
+		i = bisect_left(ys, y, 1, self.nodes_rising + 1) - 1
+		if i >= self.nodes_rising:
+			raise ValueError("Tree does not reach a height of %f." % y)
+		return i + float(y - ys[i]) / (ys[i + 1] - ys[i])
 
 	@classmethod
 	def on_class_load(cls):
@@ -111,147 +147,172 @@ class BambooTree(Actor, Climbable):
 	def get_parent_group(self, parent=None):
 		return parent
 
-	def update_batch(self, batch, parent=None):
+	def update_batch(self, batch, parent=None, wobble=None):
+		"""Add the tree to batch, or update its vertices if it has been.
+		Trees sway in a shader if wobble, the scene's TreeWobble, is given."""
 		if self.batch:
 			self.update_vertexlist()
 		else:
-			self.init_batch(batch, parent)
+			self.init_batch(batch, parent, wobble)
 			self.batch = batch
 
-	def init_batch(self, batch, parent):
+	def init_batch(self, batch, parent, wobble=None):
+		from bamboo.renderers import shaders
 		tex = self.textures['piece']
-		vertices = []
 		tex_coords = []
-
-		da = self.wobble_angle / self.height
-		pos = self.pos
-		step = Vec2(0, self.PIECE_HEIGHT).rotate(self.base_angle)
-		radius = Vec2(self.RADIUS, 0).rotate(self.base_angle)
-
-		for v in self.tree_vertices():
-			vertices += [v.x, v.y]
-
 		for i in range(self.height + 1):
 			tex_coords += [tex.tex_coords[0], (i + 1) * self.TEX_PERIOD, tex.tex_coords[3], (i + 1) * self.TEX_PERIOD]
-
-		vertices = vertices[:2] + vertices + vertices[-2:]
 		tex_coords = tex_coords[:2] + tex_coords + tex_coords[-2:]
 
 		parent_group = self.get_parent_group(parent)
+		program = shaders.get_program('tree') if wobble else None
+		if program:
+			parent_group = wobble.get_sway_group(program, self, parent=parent_group)
+			self.swaying = True
+
 		group = pyglet.sprite.SpriteGroup(self.textures['piece'], GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, parent=parent_group)
-		self.vertex_list = batch.add((self.height + 2) * 2, GL_QUAD_STRIP, group, ('v2f/stream', vertices), ('t2f/static', tex_coords))
+		n = (self.height + 2) * 2
+		if self.swaying:
+			# the shader positions each vertex from its node and side
+			segments = []
+			for i in range(self.height + 1):
+				segments += [i, 0, self.RADIUS, self.base_angle, i, 2, self.RADIUS, self.base_angle]
+			segments = segments[:4] + segments + segments[-4:]
+			self.vertex_list = batch.add(n, GL_QUAD_STRIP, group, ('v2f/static', [0] * (n * 2)), ('t2f/static', tex_coords), *self.sway_attributes(n, segments))
+		else:
+			self.vertex_list = batch.add(n, GL_QUAD_STRIP, group, 'v2f/stream', ('t2f/static', tex_coords))
+		self.vertex_lists = [(self.vertex_list, GL_QUAD_STRIP, group)]
 	
-		self.foliage = []
+		self.init_foliage(batch, parent_group)
+		self.update_vertexlist()
+
+	def init_foliage(self, batch, parent_group):
+		"""Choose leaves for the tree, and create vertex lists for them.
+
+		Rather than a sprite per leaf, the leaves are quads in one vertex
+		list per texture (usually just one, as the leaf images are loaded
+		into the same atlas). Each list is paired with its leaves, as tuples
+		(node, side, x1, y1, x2, y2) giving the node and side of the trunk the
+		leaf grows from and the corners of the leaf relative to that point.
+
+		"""
+		leaves = []
 		for i in range(self.height):
 			prob = self.height - i
 			if random.random() * prob < 1:
-				l = random.choice(['leaf1-l', 'leaf2-l'])
-				right = pyglet.sprite.Sprite(self.graphics[l], x=self.pos.x, y=self.PIECE_HEIGHT * i + self.pos.y, batch=batch, group=parent_group)
-			else:
-				right = None
+				leaves.append((i, 2, self.graphics[random.choice(['leaf1-l', 'leaf2-l'])]))
 			if random.random() * prob < 1:
-				l = random.choice(['leaf1-r', 'leaf2-r'])
-				left = pyglet.sprite.Sprite(self.graphics[l], x=self.pos.x, y=self.PIECE_HEIGHT * i + self.pos.y, batch=batch, group=parent_group)
+				leaves.append((i, 0, self.graphics[random.choice(['leaf1-r', 'leaf2-r'])]))
+		leaves.append((self.height, 1, self.graphics['top']))
+
+		by_texture = {}
+		for i, side, im in leaves:
+			by_texture.setdefault(im.get_texture().id, []).append((i, side, im))
+
+		self.foliage_lists = []
+		for ls in by_texture.values():
+			tex = ls[0][2].get_texture()
+			group = pyglet.sprite.SpriteGroup(tex, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, parent=parent_group)
+			tex_coords = []
+			corners = []
+			for i, side, im in ls:
+				tex_coords.extend(im.tex_coords)
+				x1 = -im.anchor_x
+				y1 = -im.anchor_y
+				corners.append((i, side, x1, y1, x1 + im.width, y1 + im.height))
+
+			n = len(ls) * 4
+			if self.swaying:
+				# the shader rotates the corners about their point on the trunk
+				vertices = []
+				segments = []
+				for i, side, x1, y1, x2, y2 in corners:
+					vertices += [x1, y1, x2, y1, x2, y2, x1, y2]
+					segments += [i, side, self.RADIUS, self.base_angle] * 4
+				vl = batch.add(n, GL_QUADS, group, ('v2f/static', vertices), ('t3f/static', tex_coords), *self.sway_attributes(n, segments))
 			else:
-				left = None
-			self.foliage.append((left, None, right))
-		top = pyglet.sprite.Sprite(self.graphics['top'], batch=batch, group=parent_group)
-		self.foliage.append((None, top, None))
+				vl = batch.add(n, GL_QUADS, group, 'v2f/stream', ('t3f/static', tex_coords))
+			self.foliage_lists.append((vl, corners))
+			self.vertex_lists.append((vl, GL_QUADS, group))
+
+	def sway_attributes(self, n, segments):
+		"""The data of the 'tree' shader's attributes for n vertices. They
+		are never rewritten, but see shaders.GENERIC_USAGE."""
+		from bamboo.renderers import shaders
+		return [
+			('%dg4f/%s' % (shaders.SWAY_ATTRIBUTE, shaders.GENERIC_USAGE), segments),
+			('%dg2f/%s' % (shaders.BASE_ATTRIBUTE, shaders.GENERIC_USAGE), [self.pos.x, self.pos.y] * n),
+			('%dg4f/%s' % (shaders.WIND_ATTRIBUTE, shaders.GENERIC_USAGE), self.sway_wind() * n),
+		]
+
+	def sway_wind(self):
+		"""Return how the wind bends the tree, for the 'tree' shader: the
+		wind phase at level time 0 and per update, and the still and swaying
+		parts of the wobble per segment, so that at level time t the wobble
+		per segment is still + swaying * (0.4 sin(p) + 0.2 sin(0.21p)) for
+		p = phase + t * rate, as update() computes it."""
+		rate = 1.0 / self.height
+		return [self.wind_phase - self.level.time * rate, rate, 0.0, rate]
+
+	def hide(self):
+		"""Move the trunk and foliage out of the batch while the tree is off
+		screen, into a batch of the tree's own that is never drawn."""
+		if self.batch is None or self.hidden:
+			return
+		if self.hidden_batch is None:
+			self.hidden_batch = pyglet.graphics.Batch()
+		self.migrate_vertex_lists(self.batch, self.hidden_batch)
+		self.hidden = True
+
+	def show(self):
+		"""Move the trunk and foliage back into the batch after hide()"""
+		if self.hidden:
+			self.migrate_vertex_lists(self.hidden_batch, self.batch)
+			self.hidden = False
+
+	def migrate_vertex_lists(self, batch, to):
+		for vl, mode, group in self.vertex_lists:
+			batch.migrate(vl, mode, group, to)
 
 	def update_vertexlist(self):
-#		for i, v in enumerate(self.compute_wobble()):
-#			if i == 0:
-#				self.set_trunk_vertex(0, v)
-#			elif i == self.height * 2 + 1:
-#				self.set_trunk_vertex(self.height * 2 + 3, v)
-#			self.set_trunk_vertex(i + 1, v)
-
-		vertices = []
-		for v in self.compute_wobble():
-			vertices += [v.x, v.y]
-
-		self.vertex_list.vertices = vertices[:2] + vertices + vertices[-2:]
-
-	def set_trunk_vertex(self, i, v):
-		x, y = v
-		self.vertex_list.vertices[i * 2] = x
-		self.vertex_list.vertices[i * 2 + 1] = y
+		from bamboo.renderers.treerenderer import TreeWobble
+		TreeWobble().update([self])
 
 	def tree_vertices(self):
-		da = self.wobble_angle / self.height
-
-		pos = self.pos
-		rotation = Matrix2.rotation(da)
-		step = Vec2(0, self.PIECE_HEIGHT)
-		radius = Vec2(self.RADIUS, 0)
-		angle = 0
-
-		actor_segments = {}
-		for a in self.actors:
-			h = int(a.climbing_height)
-			actor_segments.setdefault(h, []).append(a)
-
-		vertices = []
-		for i in range(self.height + 1):
-			vertices.append(pos - radius)
-			vertices.append(pos + radius)
-
-			pos += step
-			step = rotation * step
-			angle = angle + da
-			radius = (rotation * radius) * self.THINNING
-		return vertices
-
-	def compute_wobble(self):
-		"""Generator for the vertex list. Iterate to give a sequence of Vec2 objects"""
-		da = self.wobble_angle / self.height
-
-		pos = self.pos
-		rotation = Matrix2.rotation(da)
-		step = Vec2(0, self.PIECE_HEIGHT)
-		radius = Vec2(self.RADIUS, 0)
-		angle = 0
-
-		steprotation = -da * 180 / math.pi
-
-		actor_segments = {}
-		for a in self.actors:
-			h = int(a.climbing_height)
-			actor_segments.setdefault(h, []).append(a)
-
+		xs, ys, cs, ss, widths = self.get_nodes()
 		vertices = []
 		for i in range(self.height + 1):
+			pos = Vec2(xs[i], ys[i])
+			radius = Vec2(cs[i], ss[i]) * widths[i]
 			vertices.append(pos - radius)
 			vertices.append(pos + radius)
-			for side, f in enumerate(self.foliage[i]):
-				if f is None:
-					continue
-				p = pos + (side - 1) * radius
-				f.x = p.x
-				f.y = p.y
-				f.rotation = angle
-
-			for a in actor_segments.get(i, []):
-				h = a.climbing_height - i
-				apos = pos + h * step
-				a.v = apos - a.pos
-				a.pos = apos
-				a.rotation = angle
-
-			pos += step
-			step = rotation * step
-			angle += steprotation
-			radius = (rotation * radius) * self.THINNING
 		return vertices
 
 	def update(self):
 		self.wind_phase += 1.0 / self.height
 		self.wobble_angle = 0.4 * math.sin(self.wind_phase) + 0.2 * math.sin(self.wind_phase * 0.21) 
-		#self.compute_wobble()
+		self.compute_nodes()
+		self.update_climbers()
+
+	def update_climbers(self):
+		"""Move the actors climbing the tree to their place on its trunk"""
+		xs, ys = self.nodes[:2]
+		da = self.wobble_angle / self.height
+		to_degrees = -180.0 / math.pi
+		for a in self.actors:
+			i = int(a.climbing_height)
+			h = a.climbing_height - i
+			apos = Vec2(xs[i] + h * (xs[i + 1] - xs[i]), ys[i] + h * (ys[i + 1] - ys[i]))
+			a.v = apos - a.pos
+			a.pos = apos
+			a.rotation = i * da * to_degrees
 
 	def cull_bounds(self):
 		return Rect(self.pos.x - 250, self.pos.y, 500, self.height * self.PIECE_HEIGHT + 200)
 
+	def index_bounds(self):
+		return self.cull_bounds()
+
 	def draw(self):
 		self.batch.draw()
 
@@ -293,10 +354,14 @@ class BackgroundBambooTree(BambooTree):
 	def on_spawn(self):
 		self.RADIUS = random.random() ** 0.5 * 10 + 2
 		self.wobble_angle = random.random() * 1 - 0.5
-		self.compute_wobble()
+		self.compute_nodes()
 
 	def get_parent_group(self, parent=None):
 		return BackgroundGroup(self.shadow, parent=parent)
 
+	def sway_wind(self):
+		# background trees don't move from the wobble they spawned with
+		return [0.0, 0.0, float(self.wobble_angle) / self.height, 0.0]
+
 	def update(self):
 		pass
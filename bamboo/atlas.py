@@ -0,0 +1,271 @@
+"""Packs the sprite images into a few large textures.
+
+Loaded one by one, the sprites of the samurai, ninjas, corpses, leaves and
+gibs end up in many different textures, and every change of texture breaks
+up a batch. Instead every PNG under resources/sprites is packed into square
+atlases of ATLAS_SIZE pixels.
+
+Decoding and packing the PNGs is slow, so the packed pixels are saved,
+compressed, to a cache with an index of where each image went. The cache is
+keyed by the names, sizes and modification times of the sprite files, so
+after the first run startup is a decompress and an upload per atlas.
+
+"""
+import os
+import re
+import glob
+import zlib
+import struct
+import hashlib
+
+import pyglet
+
+
+SPRITE_DIR = 'resources/sprites'
+CACHE_DIR = 'cache/atlas'
+
+# Bump this whenever the packing or the file format changes
+CACHE_VERSION = 1
+
+ATLAS_SIZE = 1024
+PADDING = 2		# transparent pixels between images, so that filtering doesn't bleed
+
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+
+class AtlasError(Exception):
+	"""Sprites could not be packed, or a cached atlas could not be read"""
+
+
+def png_size(filename):
+	"""Read the width and height of a PNG from its header"""
+	f = open(filename, 'rb')
+	try:
+		header = f.read(24)
+	finally:
+		f.close()
+	if len(header) < 24 or header[:8] != PNG_SIGNATURE:
+		raise AtlasError("%s is not a PNG" % filename)
+	return struct.unpack('>II', header[16:24])
+
+
+def place(shelves, w, h, size):
+	"""Find a place for a w x h rectangle on the shelves of one atlas.
+
+	Each shelf is a list [y, height, used width]. Returns the position, or
+	None if the atlas is full.
+	"""
+	for shelf in shelves:
+		y, sh, x = shelf
+		if h <= sh and x + w <= size:
+			shelf[2] = x + w
+			return x, y
+	if shelves:
+		top = shelves[-1][0] + shelves[-1][1]
+	else:
+		top = 0
+	if top + h > size:
+		return None
+	shelves.append([top, h, w])
+	return 0, top
+
+
+def pack(sizes, size=ATLAS_SIZE, padding=PADDING):
+	"""Shelf-pack images into as few atlases as possible.
+
+	sizes maps names to (width, height). Returns a dict mapping names to
+	(atlas, x, y), and the height used in each atlas.
+	"""
+	atlases = []
+	positions = {}
+	# tallest first, so that each shelf is filled with similar heights
+	for name in sorted(sizes, key=lambda n: (-sizes[n][1], n)):
+		w, h = sizes[name]
+		w += padding
+		h += padding
+		if w > size or h > size:
+			raise AtlasError("%s is too large for a %dx%d atlas" % (name, size, size))
+		for i, shelves in enumerate(atlases):
+			pos = place(shelves, w, h, size)
+			if pos is not None:
+				break
+		else:
+			i = len(atlases)
+			atlases.append([])
+			pos = place(atlases[i], w, h, size)
+		positions[name] = (i, pos[0], pos[1])
+	heights = [shelves[-1][0] + shelves[-1][1] for shelves in atlases]
+	return positions, heights
+
+
+class SpriteAtlas(object):
+	"""The sprites, packed into atlas textures.
+
+	Call load() with a GL context current, then look up images with image().
+	"""
+	def __init__(self, path=SPRITE_DIR, cache_dir=CACHE_DIR):
+		self.path = path
+		self.cache_dir = cache_dir
+		self.name = os.path.basename(os.path.normpath(path))
+		self.textures = []
+		self.regions = {}
+
+	def sprite_files(self):
+		return sorted(glob.glob(os.path.join(self.path, '*.png')))
+
+	def key(self, files):
+		h = hashlib.sha1('%d\0%d' % (CACHE_VERSION, ATLAS_SIZE))
+		for f in files:
+			st = os.stat(f)
+			h.update('\0%s\0%d\0%d' % (os.path.basename(f), st.st_size, st.st_mtime))
+		return h.hexdigest()
+
+	def index_filename(self, key):
+		return os.path.join(self.cache_dir, '%s-%s.idx' % (self.name, key))
+
+	def atlas_filename(self, key, i):
+		return os.path.join(self.cache_dir, '%s-%s-%d.rgba' % (self.name, key, i))
+
+	def cached_files(self):
+		"""Return the files in the cache written for this atlas, for any key"""
+		owned = re.compile(r'^%s-[0-9a-f]{40}(-\d+\.rgba|\.idx|\.idx\.\d+\.tmp)$' % re.escape(self.name))
+		return [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if owned.match(f)]
+
+	def load(self):
+		"""Load the atlases from the cache, packing them first if needed"""
+		self.upload(*self.read())
+
+	def read(self):
+		"""Read the packed atlases from the cache, or pack them.
+
+		This doesn't need GL, so it can be done on a worker thread. Returns
+		the atlases and index to pass to upload().
+		"""
+		files = self.sprite_files()
+		if not files:
+			return [], {}
+		key = self.key(files)
+		try:
+			return self.read_cache(key)
+		except (IOError, AtlasError):
+			atlases, index = self.build(files)
+			self.write_cache(key, atlases, index)
+			return atlases, index
+
+	def upload(self, atlases, index):
+		"""Create the atlas textures and the regions of each image"""
+		self.textures = []
+		for w, h, data in atlases:
+			im = pyglet.image.ImageData(w, h, 'RGBA', data)
+			self.textures.append(im.get_texture())
+		self.regions = {}
+		for name, (i, x, y, w, h) in index.items():
+			self.regions[name] = self.textures[i].get_region(x, y, w, h)
+
+	def image(self, name):
+		"""Return the region of the atlas holding the named image.
+
+		Raises KeyError if the image is not in the atlas.
+		"""
+		return self.regions[name]
+
+	def build(self, files):
+		"""Decode and pack the sprites.
+
+		Returns a list of atlases, each (width, height, RGBA data), and an
+		index mapping image names to (atlas, x, y, width, height).
+		"""
+		sizes = {}
+		for f in files:
+			sizes[os.path.basename(f)] = png_size(f)
+		positions, heights = pack(sizes)
+
+		pixels = [bytearray(ATLAS_SIZE * h * 4) for h in heights]
+		stride = ATLAS_SIZE * 4
+		index = {}
+		for f in files:
+			name = os.path.basename(f)
+			i, x, y = positions[name]
+			im = pyglet.image.load(f).get_image_data()
+			w, h = im.width, im.height
+			data = im.get_data('RGBA', w * 4)
+			dest = pixels[i]
+			row = w * 4
+			# rows run bottom to top in both the image and the atlas
+			for r in xrange(h):
+				start = (y + r) * stride + x * 4
+				dest[start:start + row] = data[r * row:(r + 1) * row]
+			index[name] = (i, x, y, w, h)
+
+		atlases = [(ATLAS_SIZE, height, str(p)) for height, p in zip(heights, pixels)]
+		return atlases, index
+
+	def read_cache(self, key):
+		f = open(self.index_filename(key), 'r')
+		try:
+			lines = f.read().splitlines()
+		finally:
+			f.close()
+
+		atlases = []
+		index = {}
+		try:
+			for l in lines:
+				fields = l.split('\t')
+				if fields[0] == 'atlas':
+					i, w, h = [int(v) for v in fields[1:]]
+					f = open(self.atlas_filename(key, i), 'rb')
+					try:
+						data = zlib.decompress(f.read())
+					finally:
+						f.close()
+					if len(data) != w * h * 4:
+						raise AtlasError("Atlas %d is truncated" % i)
+					atlases.append((w, h, data))
+				elif fields[0] == 'image':
+					index[fields[1]] = tuple(int(v) for v in fields[2:])
+		except (ValueError, zlib.error), e:
+			raise AtlasError(str(e))
+		return atlases, index
+
+	def write_cache(self, key, atlases, index):
+		"""Write the packed atlases to the cache.
+
+		Failure to write is ignored; the atlases will just be packed again.
+		"""
+		written = []
+		try:
+			if not os.path.isdir(self.cache_dir):
+				os.makedirs(self.cache_dir)
+			# discard this atlas packed from older sprites
+			for old in self.cached_files():
+				os.remove(old)
+
+			for i, (w, h, data) in enumerate(atlases):
+				fname = self.atlas_filename(key, i)
+				written.append(fname)
+				f = open(fname, 'wb')
+				try:
+					f.write(zlib.compress(data, 1))
+				finally:
+					f.close()
+
+			# the index is written last, so that it is only found complete
+			fname = self.index_filename(key)
+			tmpname = '%s.%d.tmp' % (fname, os.getpid())
+			written.append(tmpname)
+			f = open(tmpname, 'w')
+			try:
+				for i, (w, h, data) in enumerate(atlases):
+					f.write('atlas\t%d\t%d\t%d\n' % (i, w, h))
+				for name in sorted(index):
+					f.write('image\t%s\t%d\t%d\t%d\t%d\t%d\n' % ((name,) + index[name]))
+			finally:
+				f.close()
+			os.rename(tmpname, fname)
+		except (IOError, OSError):
+			for fname in written:
+				try:
+					os.remove(fname)
+				except OSError:
+					pass
@@ -8,7 +8,7 @@ class Camera(object):
 		self.width = width
 		self.height = height
 
-	def get_viewport(self):
+	def get_viewport(self, alpha=1.0):
 		raise NotImplementedError("Subclasses must implement camera.get_viewport()") 
 
 	@classmethod
@@ -23,6 +23,9 @@ class Camera(object):
 class FixedCamera(Camera):
 	"""A camera with a fixed position"""
 	scale = 1
+	prev_center = None
+	prev_scale = None
+
 	def __init__(self, width, height, center=Vec2(0, 0)):
 		super(FixedCamera, self).__init__(width, height)
 		self.center = center
@@ -32,8 +35,21 @@ class FixedCamera(Camera):
 		# integer camera centers seem jumpy
 		self.center = Vec2(x, y)
 
-	def get_viewport(self):
-		return Viewport(self.width, self.height, center_x=self.center.x, center_y=self.center.y, scale=self.scale)
+	def save_state(self):
+		"""Record the current position, to interpolate from in get_viewport()"""
+		self.prev_center = self.center
+		self.prev_scale = self.scale
+
+	def get_viewport(self, alpha=1.0):
+		"""Return the viewport, interpolated by alpha between the position
+		at the last save_state() and the current position."""
+		c = self.center
+		scale = self.scale
+		if self.prev_center is not None and alpha < 1.0:
+			p = self.prev_center
+			c = p + (c - p) * alpha
+			scale = self.prev_scale + (scale - self.prev_scale) * alpha
+		return Viewport(self.width, self.height, center_x=c.x, center_y=c.y, scale=scale)
 
 
 class MovingCamera(FixedCamera):
@@ -45,10 +61,6 @@ class MovingCamera(FixedCamera):
 		"""Implement this to set where the camera should be looking"""
 		self.move_to(pos)
 
-	def get_viewport(self):
-		self.update()
-		return super(MovingCamera, self).get_viewport()
-
 
 class TrackingCamera(MovingCamera):
 	"""A camera that follows an actor"""
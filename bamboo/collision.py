@@ -0,0 +1,98 @@
+class CollisionStats(object):
+	"""Counters for the most recent collision pass, for profiling"""
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.objects = 0	# objects in the broad phase
+		self.swaps = 0		# insertion sort swaps needed to restore order
+		self.candidates = 0	# pairs passed by the broad phase
+		self.collisions = 0	# pairs whose bounds actually intersect
+
+	def __repr__(self):
+		return 'CollisionStats(objects=%d, swaps=%d, candidates=%d, collisions=%d)' % (
+			self.objects, self.swaps, self.candidates, self.collisions)
+
+
+class SweepAndPrune(object):
+	"""Broad phase collision detection.
+
+	Objects are kept in a list sorted by the left edge of their bounds.
+	Sweeping along this list, an object can only overlap those earlier
+	objects whose right edge is beyond its left edge. Objects move little
+	between frames, so the order is restored each frame with an insertion
+	sort, which is close to linear on a nearly-sorted list.
+
+	Objects must provide bounds(), collision_mask and collides_with; a pair
+	is only considered if either cares about the other's mask.
+
+	"""
+	def __init__(self):
+		self.entries = []	# [left, bounds, obj], sorted by left
+		self.index = {}
+		self.stats = CollisionStats()
+
+	def __len__(self):
+		return len(self.entries)
+
+	def add(self, obj):
+		if obj in self.index:
+			return
+		bounds = obj.bounds()
+		e = [bounds.l, bounds, obj]
+		self.index[obj] = e
+		self.entries.append(e)
+
+	def remove(self, obj):
+		try:
+			e = self.index.pop(obj)
+		except KeyError:
+			return
+		self.entries.remove(e)
+
+	def clear(self):
+		self.entries = []
+		self.index = {}
+
+	def update(self):
+		"""Recompute the bounds of every object and restore the sort order"""
+		entries = self.entries
+		for e in entries:
+			bounds = e[2].bounds()
+			e[0] = bounds.l
+			e[1] = bounds
+
+		swaps = 0
+		for i in xrange(1, len(entries)):
+			e = entries[i]
+			l = e[0]
+			j = i - 1
+			while j >= 0 and entries[j][0] > l:
+				entries[j + 1] = entries[j]
+				j -= 1
+			swaps += i - 1 - j
+			entries[j + 1] = e
+
+		self.stats.reset()
+		self.stats.objects = len(entries)
+		self.stats.swaps = swaps
+
+	def pairs(self):
+		"""Return a list of (a, b, a_bounds, b_bounds) for every pair of
+		objects whose bounds intersect. update() must be called first."""
+		stats = self.stats
+		pairs = []
+		active = []
+		for e in self.entries:
+			l, bounds, obj = e
+			active = [a for a in active if a[1].r > l]
+			for a in active:
+				other = a[2]
+				if not (obj.collides_with & other.collision_mask or other.collides_with & obj.collision_mask):
+					continue
+				stats.candidates += 1
+				if bounds.intersects(a[1]):
+					pairs.append((other, obj, a[1], bounds))
+			active.append(e)
+		stats.collisions = len(pairs)
+		return pairs
@@ -0,0 +1,397 @@
+"""Polygon tesselation by ear clipping, in pure Python.
+
+This is an alternative to the GLU tesselator in bamboo.polygontesselator. It
+gives the same kind of output, but works on flat arrays of coordinates
+rather than calling back into Python for each vertex, and it doesn't
+need GL, so it can be used in headless processes and worker threads.
+
+"""
+from array import array
+from bisect import bisect_left
+
+from bamboo.geom import Vec2
+
+
+class EarClippingError(Exception):
+	"""The polygon could not be tesselated"""
+
+
+def cross(ax, ay, bx, by, cx, cy):
+	"""Twice the signed area of the triangle abc; positive if anticlockwise"""
+	return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def point_in_triangle(px, py, ax, ay, bx, by, cx, cy):
+	"""Return True if p is inside or on the edge of the anticlockwise triangle abc"""
+	return cross(ax, ay, bx, by, px, py) >= 0 \
+		and cross(bx, by, cx, cy, px, py) >= 0 \
+		and cross(cx, cy, ax, ay, px, py) >= 0
+
+
+class EarClippingTesselator(object):
+	"""Splits Polygons into triangles by ear clipping.
+
+	Contours are classified as outlines or holes by the odd winding rule, as
+	with PolygonTesselator's default. Each hole is joined to the outline
+	that contains it by a bridge edge, and ears are then clipped from the
+	resulting simple polygons.
+
+	A contour that crosses itself, such as an open ground path closed by an
+	edge across the level, is first split into loops at the crossings.
+	Contours that cross each other, or that overlap along whole edges, are
+	not supported, and may not come out as GLU would tesselate them.
+
+	"""
+	def tesselate(self, polygon):
+		"""Return a list of triangle groups for the given polygon."""
+		from bamboo.geom import TriangleList
+		coords = self.tesselate_flat(polygon)
+		if not coords:
+			return []
+		return [TriangleList([Vec2(coords[i], coords[i + 1]) for i in xrange(0, len(coords), 2)])]
+
+	def tesselate_flat(self, polygon):
+		"""Return the triangles for the polygon as a flat array of
+		coordinates x1, y1, x2, y2, x3, y3, ... with three vertices per
+		triangle."""
+		xs = array('d')
+		ys = array('d')
+		contours = []
+		for c in polygon.contours:
+			contour = []
+			for x, y in c:
+				if contour and xs[-1] == x and ys[-1] == y:
+					continue
+				contour.append(len(xs))
+				xs.append(x)
+				ys.append(y)
+			if len(contour) > 1 and xs[contour[0]] == xs[contour[-1]] and ys[contour[0]] == ys[contour[-1]]:
+				contour.pop()
+			if len(contour) >= 3:
+				for loop in self.split_self_intersections(xs, ys, contour):
+					if len(loop) >= 3 and self.signed_area(xs, ys, loop) != 0:
+						contours.append(loop)
+
+		out = array('d')
+		for outline, holes in self.classify(xs, ys, contours):
+			ring = outline
+			for hole in sorted(holes, key=lambda h: -max(xs[i] for i in h)):
+				ring = self.bridge(xs, ys, ring, hole)
+			for part in self.split_pinches(xs, ys, ring):
+				self.clip_ears(xs, ys, part, out)
+		return out
+
+	def split_self_intersections(self, xs, ys, contour):
+		"""Split a contour that crosses itself into a list of loops that
+		don't, by adding a vertex at each crossing and swapping the paths
+		leaving it. This preserves which points are inside under the odd
+		winding rule. Crossings between different contours are not handled.
+
+		"""
+		n = len(contour)
+		edges = []
+		for k in xrange(n):
+			a = contour[k]
+			b = contour[(k + 1) % n]
+			edges.append((min(xs[a], xs[b]), max(xs[a], xs[b]), k))
+		edges.sort()
+
+		# sweep along x, testing edges whose x ranges overlap
+		crossings = {}
+		active = []
+		for lo, hi, k in edges:
+			active = [e for e in active if e[1] >= lo]
+			a = contour[k]
+			b = contour[(k + 1) % n]
+			for e in active:
+				j = e[2]
+				if abs(j - k) in (1, n - 1):
+					continue	# adjacent edges share a vertex
+				c = contour[j]
+				d = contour[(j + 1) % n]
+				ax, ay, bx, by = xs[a], ys[a], xs[b], ys[b]
+				cx, cy, dx, dy = xs[c], ys[c], xs[d], ys[d]
+				d1 = cross(cx, cy, dx, dy, ax, ay)
+				d2 = cross(cx, cy, dx, dy, bx, by)
+				d3 = cross(ax, ay, bx, by, cx, cy)
+				d4 = cross(ax, ay, bx, by, dx, dy)
+				if (d1 > 0) != (d2 > 0) and (d3 > 0) != (d4 > 0) and d1 and d2 and d3 and d4:
+					t = d1 / (d1 - d2)
+					u = d3 / (d3 - d4)
+					v = len(xs)
+					xs.append(ax + t * (bx - ax))
+					ys.append(ay + t * (by - ay))
+					crossings.setdefault(k, []).append((t, v))
+					crossings.setdefault(j, []).append((u, v))
+			active.append((lo, hi, k))
+
+		if not crossings:
+			return [contour]
+
+		seq = []
+		for k in xrange(n):
+			seq.append(contour[k])
+			seq.extend(v for t, v in sorted(crossings.get(k, ())))
+
+		# each crossing vertex now appears twice in seq; swap what follows
+		# the two appearances, then trace out the loops that results in
+		m = len(seq)
+		following = range(1, m) + [0]
+		first = {}
+		for pos in xrange(m):
+			v = seq[pos]
+			if v in first:
+				other = first[v]
+				following[pos], following[other] = following[other], following[pos]
+			else:
+				first[v] = pos
+
+		loops = []
+		done = [False] * m
+		for start in xrange(m):
+			if done[start]:
+				continue
+			loop = []
+			pos = start
+			while not done[pos]:
+				done[pos] = True
+				loop.append(seq[pos])
+				pos = following[pos]
+			loops.append(loop)
+		return loops
+
+	def signed_area(self, xs, ys, contour):
+		a = 0.0
+		j = contour[-1]
+		for i in contour:
+			a += xs[j] * ys[i] - xs[i] * ys[j]
+			j = i
+		return a * 0.5
+
+	def contains(self, xs, ys, contour, px, py):
+		"""Return True if point p is inside contour, by counting crossings"""
+		inside = False
+		j = contour[-1]
+		for i in contour:
+			xi, yi = xs[i], ys[i]
+			xj, yj = xs[j], ys[j]
+			if (yi > py) != (yj > py) and px < xi + (py - yi) * (xj - xi) / (yj - yi):
+				inside = not inside
+			j = i
+		return inside
+
+	def classify(self, xs, ys, contours):
+		"""Group contours into a list of (outline, holes) by nesting depth.
+
+		Outlines are returned anticlockwise and holes clockwise.
+		"""
+		# for each contour, the indices of the other contours enclosing it;
+		# contours may touch at vertices, so test the middle of an edge
+		within = []
+		for c in contours:
+			px = (xs[c[0]] + xs[c[1]]) * 0.5
+			py = (ys[c[0]] + ys[c[1]]) * 0.5
+			within.append([j for j, o in enumerate(contours) if o is not c and self.contains(xs, ys, o, px, py)])
+
+		groups = {}
+		order = []
+		for i, c in enumerate(contours):
+			if len(within[i]) % 2 == 0:
+				if self.signed_area(xs, ys, c) < 0:
+					c = c[::-1]
+				groups[i] = (c, [])
+				order.append(i)
+
+		for i, c in enumerate(contours):
+			depth = len(within[i])
+			if depth % 2 == 1:
+				# the hole belongs to the outline directly enclosing it
+				parent = max(within[i], key=lambda j: len(within[j]))
+				if parent not in groups:
+					continue
+				if self.signed_area(xs, ys, c) > 0:
+					c = c[::-1]
+				groups[parent][1].append(c)
+		return [groups[i] for i in order]
+
+	def bridge(self, xs, ys, ring, hole):
+		"""Join a hole into an outline ring, returning a new ring.
+
+		This follows Eberly's method: cast a ray rightwards from the
+		rightmost vertex of the hole, and connect to the nearest vertex of
+		the ring that is visible from it.
+
+		"""
+		# contours split at a crossing share the vertex there; join at it
+		shared = set(hole).intersection(ring)
+		if shared:
+			m = min(shared)
+			p = ring.index(m)
+			h = hole.index(m)
+			return ring[:p] + hole[h:] + hole[:h] + ring[p:]
+
+		m = max(hole, key=lambda i: (xs[i], ys[i]))
+		mx, my = xs[m], ys[m]
+
+		n = len(ring)
+		hit = None
+		hit_x = None
+		for k in xrange(n):
+			a = ring[k]
+			b = ring[(k + 1) % n]
+			ay, by = ys[a], ys[b]
+			if (ay > my) == (by > my):
+				continue
+			x = xs[a] + (my - ay) * (xs[b] - xs[a]) / (by - ay)
+			if x >= mx and (hit is None or x < hit_x):
+				hit = k
+				hit_x = x
+		if hit is None:
+			raise EarClippingError("Hole is not inside its outline")
+
+		a = ring[hit]
+		b = ring[(hit + 1) % n]
+		p = hit if xs[a] > xs[b] else (hit + 1) % n
+		px, py = xs[ring[p]], ys[ring[p]]
+
+		# A reflex vertex inside the triangle M, I, P may obscure P; if so,
+		# connect to the one making the smallest angle with the ray instead.
+		if hit_x != px or my != py:
+			if py < my:
+				tri = (mx, my, px, py, hit_x, my)
+			else:
+				tri = (mx, my, hit_x, my, px, py)
+			best = None
+			for k in xrange(n):
+				v = ring[k]
+				vx, vy = xs[v], ys[v]
+				if k == p or vx < mx or (vx == mx and vy == my):
+					continue
+				u = ring[k - 1]
+				w = ring[(k + 1) % n]
+				if cross(xs[u], ys[u], vx, vy, xs[w], ys[w]) >= 0:
+					continue	# not reflex
+				if point_in_triangle(vx, vy, *tri):
+					key = (abs(vy - my) / (vx - mx) if vx > mx else float('inf'), vx - mx)
+					if best is None or key < best[0]:
+						best = (key, k)
+			if best is not None:
+				p = best[1]
+
+		h = hole.index(m)
+		return ring[:p + 1] + hole[h:] + hole[:h + 1] + ring[p:]
+
+	def split_pinches(self, xs, ys, ring):
+		"""Split a ring that passes through a vertex more than once into
+		rings that don't, where the parts either side of the vertex lie side
+		by side.
+
+		A hole that touches its outline at several crossings, as in a
+		pentagram, leaves the ring pinched at each of them, and the ear
+		test can't tell which side of a pinch an ear is on. A part that
+		winds clockwise is a hole joined at the vertex, and is left joined.
+
+		"""
+		parts = []
+		stack = [ring]
+		while stack:
+			ring = stack.pop()
+			seen = {}
+			for pos, v in enumerate(ring):
+				if v in seen:
+					a = ring[seen[v]:pos]
+					b = ring[pos:] + ring[:seen[v]]
+					if self.signed_area(xs, ys, a) > 0 and self.signed_area(xs, ys, b) > 0:
+						stack.append(a)
+						stack.append(b)
+						break
+				seen[v] = pos
+			else:
+				parts.append(ring)
+		return parts
+
+	def clip_ears(self, xs, ys, ring, out):
+		"""Triangulate a simple anticlockwise ring of vertex indices,
+		appending the triangles' coordinates to out."""
+		n = len(ring)
+		if n < 3:
+			return
+		prev = range(-1, n - 1)
+		prev[0] = n - 1
+		next = range(1, n + 1)
+		next[-1] = 0
+		alive = [True] * n
+
+		def corner(k):
+			u, v, w = ring[prev[k]], ring[k], ring[next[k]]
+			return cross(xs[u], ys[u], xs[v], ys[v], xs[w], ys[w])
+
+		# Only reflex vertices can lie inside an ear. Clipping never makes a
+		# vertex reflex, so keep them sorted by x and discard them lazily.
+		reflex = [False] * n
+		candidates = []
+		for k in xrange(n):
+			if corner(k) < 0:
+				reflex[k] = True
+				candidates.append((xs[ring[k]], ys[ring[k]], k))
+		candidates.sort()
+
+		def is_ear(k):
+			u, v, w = ring[prev[k]], ring[k], ring[next[k]]
+			ax, ay, bx, by, cx, cy = xs[u], ys[u], xs[v], ys[v], xs[w], ys[w]
+			if cross(ax, ay, bx, by, cx, cy) <= 0:
+				return False
+			lo = min(ax, bx, cx)
+			hi = max(ax, bx, cx)
+			for j in xrange(bisect_left(candidates, (lo,)), len(candidates)):
+				px, py, r = candidates[j]
+				if px > hi:
+					break
+				if not reflex[r] or r == prev[k] or r == next[k]:
+					continue
+				if (px == ax and py == ay) or (px == bx and py == by) or (px == cx and py == cy):
+					continue
+				if point_in_triangle(px, py, ax, ay, bx, by, cx, cy):
+					return False
+			return True
+
+		def unlink(k):
+			alive[k] = False
+			reflex[k] = False
+			p, q = prev[k], next[k]
+			next[p] = q
+			prev[q] = p
+			for j in (p, q):
+				if reflex[j] and corner(j) > 0:
+					reflex[j] = False
+
+		remaining = n
+		k = 0
+		stalled = 0
+		while remaining > 3:
+			c = corner(k)
+			if c == 0:
+				# drop degenerate vertices without emitting a triangle
+				nk = next[k]
+				unlink(k)
+				remaining -= 1
+				k = nk
+				stalled = 0
+				continue
+			if is_ear(k) or stalled > remaining:
+				# if no ear can be found the ring must self-intersect;
+				# clip anyway rather than loop forever
+				u, v, w = ring[prev[k]], ring[k], ring[next[k]]
+				out.extend((xs[u], ys[u], xs[v], ys[v], xs[w], ys[w]))
+				nk = next[k]
+				unlink(k)
+				remaining -= 1
+				k = nk
+				stalled = 0
+			else:
+				k = next[k]
+				stalled += 1
+
+		if corner(k) != 0:
+			u, v, w = ring[prev[k]], ring[k], ring[next[k]]
+			out.extend((xs[u], ys[u], xs[v], ys[v], xs[w], ys[w]))
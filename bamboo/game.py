@@ -5,20 +5,32 @@ import pyglet
 from pyglet.window import key
 from pyglet import gl
 
-from bamboo.gamestate import GameState, BambooWarriorGameState
-from bamboo.menu import MenuGameState
+from bamboo import startup
+from bamboo import timing
+from bamboo.gamestate import GameState
+from bamboo.resources import init_resources, collect_resources
 
-FPS = 30.0
+FPS = 30.0	# logic updates per second
+TIMESTEP = 1.0 / FPS
+
+# The most logic updates to run before drawing a frame. If the game falls
+# further behind than this, it slows down rather than never drawing.
+MAX_STEPS = 5
 
 class Game(object):
 	def __init__(self, options):
 		"""Here options is an optparse object or similar that contains a few
 		commandline options for configuring the game, eg. fullscreen and window dims
 		"""
-		self.init_resources()
 		self.window = self.create_window(options)
 		self.init_events()
 		self.gamestate = GameState()
+		self.accumulator = 0.0
+		self.alpha = 1.0
+		self.frames = 0
+		self.timings_file = options.timings
+		self.timing_overlay = None
+		self.show_timings = False
 
 		if options.showfps:
 			self.fps = pyglet.clock.ClockDisplay()
@@ -26,8 +38,9 @@ class Game(object):
 			self.fps = None
 
 	def init_resources(self):
-		pyglet.resource.path = ['resources/sprites', 'resources/textures', 'resources/music', 'resources/sounds', 'resources/levels']
-		pyglet.resource.reindex()
+		"""Index the resource directories; done on the first frames by
+		LoadingGameState rather than before the window opens."""
+		init_resources()
 
 	def create_window(self, options):
 		mo = re.match(r'(\d+)x(\d+)', options.resolution)
@@ -49,6 +62,9 @@ class Game(object):
 		if code == key.F12:
 			print "Wrote", self.save_screenshot()
 			return pyglet.event.EVENT_HANDLED
+		elif code == key.F3:
+			self.show_timings = not self.show_timings
+			return pyglet.event.EVENT_HANDLED
 		return self.gamestate.on_key_press(code, modifiers)
 
 	def save_screenshot(self):
@@ -70,20 +86,56 @@ class Game(object):
 		self.window.push_handlers(self.keys)
 
 	def set_gamestate(self, gamestate):
+		old = self.gamestate
 		self.gamestate = gamestate
+		# a menu shown over a gamestate keeps it as its child
+		if old is not getattr(gamestate, 'child', None):
+			old.stop()
 		gamestate.start()
 
-	def update(self, x):
+	def tick(self, dt):
+		"""Run as many logic updates as the time since the last frame calls
+		for, and work out how far we are between the last two for drawing."""
+		self.accumulator += dt
+		steps = 0
+		while self.accumulator >= TIMESTEP:
+			if steps == MAX_STEPS:
+				self.accumulator = 0.0
+				break
+			self.update(TIMESTEP)
+			self.accumulator -= TIMESTEP
+			steps += 1
+		self.alpha = self.accumulator / TIMESTEP
+		collect_resources()
+
+	def update(self, dt):
 		"""Update the world, or delegate to something that will"""
-		self.gamestate.update(self.keys)
+		with timing.timed('logic'):
+			self.gamestate.update(self.keys)
 
 	def draw(self):
 		"""Draw the scene, or delegate to something that will"""
-		self.gamestate.draw()
+		with timing.timed('draw'):
+			self.gamestate.draw(self.alpha)
 		if self.fps:
 			self.fps.draw()
+		if self.show_timings:
+			self.draw_timings()
+		timing.end_frame()
+		if not self.frames:
+			startup.mark('first frame')
+		self.frames += 1
 	
+	def draw_timings(self):
+		if self.timing_overlay is None:
+			from bamboo.hud import TimingOverlay
+			self.timing_overlay = TimingOverlay(self.window, timing.timers)
+		self.timing_overlay.draw()
+
 	def run(self):
-		pyglet.clock.schedule_interval(self.update, (1.0/FPS))
-		pyglet.clock.set_fps_limit(FPS)
+		# draw as often as vsync allows; logic runs at FPS regardless
+		pyglet.clock.schedule(self.tick)
 		pyglet.app.run()
+		if self.timings_file:
+			timing.timers.write_csv(self.timings_file)
+			print "Wrote", self.timings_file
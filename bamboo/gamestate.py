@@ -1,35 +1,112 @@
+import time
+
 import pyglet
+from pyglet import gl
 
 from bamboo.geom import Vec2
+from bamboo.preloader import LevelPreloader, ResourcePreloader
 from pyglet.window import key
 
+from bamboo import startup
 from bamboo.keybindings import load_bindings
+from bamboo.timing import timed
 
 
 class GameState(object):
 	def start(self):
 		"""Called when the gamestate is first activated"""
 
-	def draw(self):
-		"""Called once per frame to handle drawing"""
+	def stop(self):
+		"""Called when the gamestate is replaced, to release what it holds"""
+
+	def draw(self, alpha=1.0):
+		"""Called once per frame to handle drawing; alpha is how far we are
+		from the previous logic update to the next, for interpolation"""
 
 	def update(self, keys):
-		"""Called once per frame to update the logic;
+		"""Called at a fixed rate to update the logic;
 		keys is a KeyStateHandler that contains the current state of the keyboard"""
 
+	def update_paused(self):
+		"""Called in place of update() while a menu is shown over this gamestate"""
+
 	def on_key_press(self, code, modifiers):
 		"""Called when a key is pressed"""
 
 
+class LoadingGameState(GameState):
+	"""Shows a progress bar while the game starts up.
+
+	So that the window appears as soon as possible, nothing is loaded before
+	the first frame. Then the work of starting up is done a step per frame:
+	indexing the resources, loading the first level on a worker thread, and
+	finally calling create(preloader) to build the gamestate that replaces
+	this one.
+
+	"""
+	BACKGROUND = (0.07, 0.09, 0.05)
+	BAR_COLOUR = (0x6c, 0x88, 0x4b)
+
+	def __init__(self, game, level, create):
+		self.game = game
+		self.level = level
+		self.create = create
+		self.preloader = LevelPreloader()
+		self.steps = [self.index_resources, self.request_level, self.wait_for_level, self.finish]
+		self.step = 0
+		self.frames = 0
+
+	def index_resources(self):
+		self.game.init_resources()
+		return True
+
+	def request_level(self):
+		self.preloader.request(self.level)
+		return True
+
+	def wait_for_level(self):
+		return self.preloader.ready(self.level)
+
+	def finish(self):
+		startup.mark('level loaded')
+		gl.glClearColor(0, 0, 0, 1)
+		self.game.set_gamestate(self.create(self.preloader))
+		startup.finished()
+		return True
+
+	def update(self, keys):
+		# let the splash be drawn before doing any work
+		if self.frames and self.step < len(self.steps):
+			if self.steps[self.step]():
+				self.step += 1
+
+	def draw(self, alpha=1.0):
+		self.frames += 1
+		gl.glClearColor(*(self.BACKGROUND + (1,)))
+		self.game.window.clear()
+		w = self.game.window.width
+		h = self.game.window.height
+		l = w // 4
+		r = l + (w // 2) * self.step // len(self.steps)
+		b = h // 2 - 4
+		t = b + 8
+		pyglet.graphics.draw(4, gl.GL_QUADS,
+			('v2i', [l, b, r, b, r, t, l, t]),
+			('c3B', self.BAR_COLOUR * 4)
+		)
+
+
 class BambooWarriorGameState(GameState):
 	"""Represents the activities of the game at a given point.
 	It should be possible to replace the gamestate to do something different
 	with input or graphics."""
 
-	def __init__(self, game, levels=['level1.svg', 'level2.svg', 'level3.svg', 'level4.svg']):
+	def __init__(self, game, levels=['level1.svg', 'level2.svg', 'level3.svg', 'level4.svg'], preloader=None):
 		self.game = game
 		self.huds = []
 		self.levels = levels[:]
+		self.preloader = preloader or LevelPreloader()
+		self.resource_preloader = ResourcePreloader()
 		self.start_level(self.levels.pop(0))
 		self.keybindings = load_bindings()
 
@@ -45,19 +122,49 @@ class BambooWarriorGameState(GameState):
 		self.start()
 
 	def start_level(self, level):
-		from bamboo.levelloader import SVGLevelLoader
 		from bamboo.scene import Scene
 
-		loader = SVGLevelLoader()
-		self.level = loader.load(level)
+		start = time.time()
+		previous = getattr(self, 'level', None)
+		self.level = self.preloader.get(level)
+		loaded = time.time()
+		resource_times = self.load_resources()
+		resourced = time.time()
 		self.scene = Scene(self.game.window, self.level)
 		self.scene.camera = self.get_camera()
 		self.level.restart()
+		if previous is not None:
+			# after spawning, so that actors in both levels stay loaded
+			previous.teardown()
+		end = time.time()
+		if startup.profiling:
+			print "Started %s in %.1fms (%.1fms waiting for load, %.1fms loading resources, %.1fms building scene)" % (
+				level, (end - start) * 1000, (loaded - start) * 1000, (resourced - loaded) * 1000, (end - resourced) * 1000)
+			if resource_times:
+				self.resource_preloader.report(resource_times)
+
+		# load the next level while this one is played
+		if self.levels:
+			self.preloader.request(self.levels[0])
+
+	def load_resources(self):
+		"""Load the resources of everything the level will need, before it starts"""
+		from bamboo.actors.samurai import Samurai
+		from bamboo.renderers.terrainrenderer import TerrainRenderer, GrassStrip
+		classes = self.level.get_resource_classes() + [Samurai, TerrainRenderer, GrassStrip]
+		self.resource_preloader.add(*classes)
+		times = self.resource_preloader.load()
+		# counted, so that they are unloaded once no level needs them
+		self.level.hold_resources(classes)
+		return times
 
 	def next_level(self):
 		self.start_level(self.levels.pop(0))
 		self.start(self.pc)
 
+	def stop(self):
+		self.level.teardown()
+
 	def start(self, pc=None):
 		"""Start is called when the gamestate is initialised"""
 		#music = pyglet.resource.media('shika-no-toone.ogg')
@@ -113,6 +220,7 @@ class BambooWarriorGameState(GameState):
 		self.level.spawn(self.pc, x=60, controller=self.player)
 
 	def update(self, keys):
+		self.scene.save_state()
 		player = self.player
 		p1bindings = self.keybindings['player1']
 	
@@ -140,34 +248,39 @@ class BambooWarriorGameState(GameState):
 					self.end_game()
 
 		self.level.update()
+		self.scene.step()
 
-	def draw(self):
-		self.scene.update()
-		self.scene.camera.update()
-		self.scene.draw()
-		for h in self.huds:
-			h.update_batch()
-			h.draw()
+	def draw(self, alpha=1.0):
+		self.scene.update(alpha)
+		self.scene.draw(alpha)
+		with timed('hud'):
+			for h in self.huds:
+				h.update_batch()
+				h.draw()
 
 
 class StaticLevelGameState(BambooWarriorGameState):
 	"""A gamestate that renders a static level. Used by the menu system"""
-	def __init__(self, game, levels=['title.svg']):
-		super(StaticLevelGameState, self).__init__(game, levels)
+	def __init__(self, game, levels=['title.svg'], preloader=None):
+		super(StaticLevelGameState, self).__init__(game, levels, preloader)
 
 	def update(self, keys):
+		self.scene.save_state()
 		self.level.update_scenery()
+		self.scene.step()
 
-	def draw(self):
+	def update_paused(self):
 		self.update({})
+
+	def draw(self, alpha=1.0):
 		self.scene.camera.move_to(Vec2(60, 60))
-		self.scene.update()
-		self.scene.draw()
+		self.scene.update(alpha)
+		self.scene.draw(alpha)
 
 
 class MultiplayerGameState(BambooWarriorGameState):
-	def __init__(self, game, levels=['arena.svg']):
-		super(MultiplayerGameState, self).__init__(game, levels)
+	def __init__(self, game, levels=['arena.svg'], preloader=None):
+		super(MultiplayerGameState, self).__init__(game, levels, preloader)
 
 	def get_camera(self):
 		from bamboo import camera
@@ -200,6 +313,7 @@ class MultiplayerGameState(BambooWarriorGameState):
 		self.level.spawn(self.pc2, x=self.level.width - 60, controller=self.player2)
 
 	def update(self, keys):
+		self.scene.save_state()
 		player1 = self.player1
 		player2 = self.player2
 		p1bindings = self.keybindings['player1']
@@ -247,11 +361,12 @@ class MultiplayerGameState(BambooWarriorGameState):
 			self.scene.camera.track(self.pc2.pos)
 
 		self.level.update()
-
-	def draw(self):
-		self.scene.update()
-		self.scene.camera.update()
-		self.scene.draw()
-		for h in self.huds:
-			h.update_batch()
-			h.draw()
+		self.scene.step()
+
+	def draw(self, alpha=1.0):
+		self.scene.update(alpha)
+		self.scene.draw(alpha)
+		with timed('hud'):
+			for h in self.huds:
+				h.update_batch()
+				h.draw()
@@ -290,6 +290,11 @@ class Polygon(object):
 	"""Mutable polygon, possibly with holes, multiple contours, etc.
 
 	This exists mainly as a wrapper for polygon tesselation, but also provides some useful methods"""
+	TESSELATORS = {
+		'glu': 'bamboo.polygontesselator.PolygonTesselator',
+		'earclip': 'bamboo.earclipping.EarClippingTesselator',
+	}
+
 	def __init__(self, vertices=None):
 		self.contours = []
 		if vertices:
@@ -302,9 +307,21 @@ class Polygon(object):
 			p.add_contour(mirrored)
 		return p
 
-	def tesselate(self):
-		from bamboo.polygontesselator import PolygonTesselator
-		return PolygonTesselator().tesselate(self)
+	def tesselate(self, engine='glu'):
+		"""Split the polygon into a list of triangle groups.
+
+		engine names the tesselator to use, one of TESSELATORS; 'glu' needs
+		a GL context, while 'earclip' is pure Python.
+		"""
+		try:
+			modpath = self.TESSELATORS[engine]
+		except KeyError:
+			raise ValueError("Unknown tesselator %r" % engine)
+		parts = modpath.split('.')
+		classname = parts[-1]
+		modname = '.'.join(parts[:-1])
+		mod = __import__(modname, {}, {}, [classname])
+		return getattr(mod, classname)().tesselate(self)
 
 	def polylines_facing(self, v, threshold=0):
 		"""Compute a list of PolyLines on the edge of this contour whose normals face v.
@@ -407,6 +424,61 @@ class ConvexPolygon(object):
 			yield LineSegment(self.vertices[v1], self.vertices[v2])
 
 
+class TriangleStrip(object):
+	def __init__(self, vertices):
+		self.vertices = vertices
+
+	def triangles(self):
+		vs = self.vertices[:]
+		p1 = vs.pop(0)
+		p2 = vs.pop(0)
+		while vs: 
+			p3 = vs.pop(0)
+			yield ConvexPolygon([p1, p2, p3])
+			p1 = p2
+			p2 = p3
+
+	def gl_vertices(self):
+		from pyglet.gl import GL_TRIANGLE_STRIP
+		return GL_TRIANGLE_STRIP, self.vertices
+
+
+class TriangleFan(object):
+	def __init__(self, vertices):
+		self.vertices = vertices
+
+	def triangles(self):
+		vs = self.vertices[:]
+		c = vs.pop(0)
+		p2 = vs.pop(0)
+		while vs:
+			p3 = vs.pop(0)
+			yield ConvexPolygon([c, p2, p3])
+			p2 = p3
+
+	def gl_vertices(self):
+		from pyglet.gl import GL_TRIANGLES
+		vs = []
+		for t in self.triangles():
+			vs += reversed(t.vertices)
+		return GL_TRIANGLES, vs
+
+
+class TriangleList(object):
+	def __init__(self, vertices):
+		self.vertices = vertices
+
+	def triangles(self):
+		vs = self.vertices[:]
+		while vs:
+			yield ConvexPolygon(vs[:3])
+			vs = vs[3:]
+	
+	def gl_vertices(self):
+		from pyglet.gl import GL_TRIANGLES
+		return GL_TRIANGLES, self.vertices
+
+
 if __name__ == '__main__':
 	import doctest
 	doctest.testmod()
@@ -0,0 +1,80 @@
+"""Run the game logic without a window, textures or batches.
+
+This is for benchmarking and regression testing the simulation on machines
+without a GPU, and for running it much faster than real time.
+
+"""
+import time
+
+from bamboo.geom import Vec2
+from bamboo.resources import init_resources
+
+
+class HeadlessSimulation(object):
+	"""Loads a level and steps Level.update as fast as possible.
+
+	A Samurai is spawned and driven as a player would: running right,
+	attacking at regular intervals, and respawning at the start of the level
+	when it dies or reaches the end. This gives the AI something to fight.
+
+	"""
+	ATTACK_INTERVAL = 15	# frames between player attacks
+
+	def __init__(self, levelname, player=True):
+		from bamboo.levelloader import SVGLevelLoader
+		init_resources()
+		# tesselate without GL, in case the compiled level isn't cached
+		self.level = SVGLevelLoader(tesselator='earclip').load(levelname)
+		self.level.headless = True
+		self.level.restart()
+		self.frame = 0
+		self.pc = None
+		if player:
+			self.create_player()
+
+	def create_player(self):
+		from bamboo.actors.samurai import Samurai
+		from bamboo.actors.playercharacter import PlayerController
+		self.pc = Samurai()
+		self.player = PlayerController(self.pc)
+		self.pc.add_death_listener(self.on_player_death)
+		self.respawn = True
+
+	def on_player_death(self, pc):
+		self.respawn = True
+
+	def spawn_player(self):
+		self.pc.v = Vec2(0, 0)
+		self.level.spawn(self.pc, x=60, controller=self.player)
+		self.respawn = False
+
+	def update_player(self):
+		if self.respawn:
+			self.spawn_player()
+
+		if self.pc.pos.x > self.level.width:
+			self.level.kill(self.pc)
+			self.spawn_player()
+
+		self.player.right()
+		if self.frame % self.ATTACK_INTERVAL == 0:
+			self.player.attack()
+
+	def step(self):
+		"""Simulate one frame"""
+		if self.pc is not None:
+			self.update_player()
+		self.level.update()
+		self.frame += 1
+
+	def run(self, frames):
+		"""Simulate the given number of frames and return the time taken"""
+		start = time.time()
+		for i in xrange(frames):
+			self.step()
+		return time.time() - start
+
+	def report(self, frames, elapsed):
+		fps = frames / elapsed if elapsed else float('inf')
+		print "Simulated %d frames in %.2fs: %.1f frames per second" % (frames, elapsed, fps)
+		print "%d actors alive, %d characters" % (len(self.level.actors), len(self.level.characters))
@@ -85,3 +85,36 @@ class HUD(ResourceTracker):
 			glPopMatrix()
 		else:
 			self.batch.draw()
+
+
+class TimingOverlay(object):
+	"""Shows percentiles of each timer (see bamboo.timing) over the last
+	few seconds, in milliseconds."""
+	REFRESH = 15	# frames between updates of the text
+	WIDTH = 480
+
+	def __init__(self, window, timers):
+		self.window = window
+		self.timers = timers
+		self.frames = 0
+		self.label = pyglet.text.Label('', font_name='Courier New', font_size=10,
+			x=window.width - self.WIDTH - 10, y=window.height - 10,
+			width=self.WIDTH, multiline=True, anchor_y='top')
+
+	def update(self):
+		if self.frames % self.REFRESH == 0:
+			lines = ['%-20s%8s%8s%8s%8s' % ('ms', 'p50', 'p90', 'p99', 'max')]
+			for t in self.timers.timers:
+				ps = t.recent_percentiles([0.5, 0.9, 0.99, 1.0])
+				lines.append('%-20s' % t.name + ''.join(['%8.2f' % (p * 1000) for p in ps]))
+			self.label.text = '\n'.join(lines)
+		self.frames += 1
+
+	def draw(self):
+		self.update()
+		l = self.label
+		r = Rect(l.x - 5, l.y - l.content_height - 5, self.WIDTH + 10, l.content_height + 10)
+		glEnable(GL_BLEND)
+		glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+		pyglet.graphics.draw(4, GL_QUADS, ('v2f', r.vertices()), ('c4B', (0, 0, 0, 160) * 4))
+		l.draw()
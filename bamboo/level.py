@@ -1,4 +1,8 @@
 from bamboo.geom import Vec2
+from bamboo.spatial import SpatialGrid
+from bamboo.collision import SweepAndPrune
+from bamboo.pool import ActorPool
+from bamboo.timing import timed
 
 class ActorSpawn(object):
 	NAME_MAP = {
@@ -35,6 +39,11 @@ class ActorSpawn(object):
 
 
 class Level(object):
+	GRID_CELL_SIZE = 256
+	CHARACTER_REACH = 160	# characters' bounds lie within this distance of their pos
+
+	headless = False	# if True, don't load graphics for actors
+
 	def __init__(self, width, height, ground, actor_spawns=[]):
 		self.width = width
 		self.height = height
@@ -44,20 +53,83 @@ class Level(object):
 		self.climbables = []
 		self.characters = []
 		self.controllers = []
+		self.grid = self.create_grid()
+		self.colliders = SweepAndPrune()
+		self.pools = {}
+		self.time = 0		# the number of logic updates run
+		self.held = []		# classes whose resources are held for the level
+		self.create_particle_systems()
 
-	def restart(self):
+	def create_particle_systems(self):
+		from bamboo.actors.particles import SmokeParticles
+		self.smoke = SmokeParticles()
+		self.particle_systems = [self.smoke]
+
+	def create_grid(self):
+		"""Create the spatial index of actors."""
+		if len(self.ground.polygon.contours) > 1:
+			# levels made of several islands can stack actors vertically
+			return SpatialGrid(self.GRID_CELL_SIZE, self.GRID_CELL_SIZE)
+		return SpatialGrid(self.GRID_CELL_SIZE)
+
+	def hold_resources(self, classes):
+		"""Keep the resources of classes loaded until teardown(), even
+		while no actor of them is alive."""
+		if self.headless:
+			return
+		for cls in classes:
+			cls.acquire_resources()
+			self.held.append(cls)
+
+	def teardown(self):
+		"""Remove every actor from the level, and release the resources of
+		the actors and those held with hold_resources()."""
+		self.remove_actors()
+		for cls in self.held:
+			cls.release_resources()
+		self.held = []
+
+	def remove_actors(self):
+		"""Remove every actor from the level, releasing their resources"""
+		if not self.headless:
+			for a in self.actors:
+				a.release_resources()
 		self.actors = []
+		self.characters = []
+		self.climbables = []
+		self.controllers = []
+		self.grid.clear()
+		self.colliders.clear()
+		self.pools = {}
+		for p in self.particle_systems:
+			p.clear()
+
+	def get_resource_classes(self):
+		"""Return the classes of the actors the level spawns, and of those
+		they may spawn in turn."""
+		classes = []
+		pending = [s.get_class() for s in self.actor_spawns]
+		while pending:
+			cls = pending.pop()
+			if cls not in classes:
+				classes.append(cls)
+				pending.extend(cls.get_spawned_classes())
+		return classes
+
+	def restart(self):
+		self.remove_actors()
 		for spawnpoint in self.actor_spawns:
 			spawnpoint.spawn(self)
 			
 	def spawn(self, actor, x, y=None, controller=None):
-		if not actor._resources_loaded:
-			actor.load_resources()
+		if not self.headless:
+			actor.acquire_resources()
 
 		if y is None:
 			y = self.ground.height_at(x)
-		actor.pos = Vec2(x, y)
 		actor.level = self
+		actor.pos = Vec2(x, y)
+		actor._prev_pos = None	# don't interpolate from where it was before
 
 		if controller is not None:
 			actor.controller = controller
@@ -71,8 +143,24 @@ class Level(object):
 			if actor.is_climbable():
 				self.climbables.append(actor)
 		self.actors.append(actor)
+		if actor.collision_mask:
+			self.colliders.add(actor)
 		actor.on_spawn()
 
+	def spawn_pooled(self, cls, x, y=None, *args, **kwargs):
+		"""Spawn an actor of class cls, recycling a dead one if possible.
+
+		The remaining arguments are passed to the constructor or reset().
+		cls.POOL_SIZE limits how many can be alive at once.
+		"""
+		try:
+			pool = self.pools[cls]
+		except KeyError:
+			pool = self.pools[cls] = ActorPool(cls, cls.POOL_SIZE)
+		actor = pool.acquire(self, *args, **kwargs)
+		self.spawn(actor, x, y)
+		return actor
+
 	def kill(self, actor):
 		from bamboo.actors.samurai import Character
 		from bamboo.actors.trees import Climbable
@@ -84,75 +172,149 @@ class Level(object):
 			except ValueError:
 				pass
 		self.actors.remove(actor)
+		self.grid.remove(actor)
+		self.colliders.remove(actor)
 		if actor.controller:
 			actor.controller.on_character_death()
 			self.controllers.remove(actor.controller)
-		actor.delete()
+		if actor.pool is not None:
+			actor.pool.release(actor)
+		else:
+			actor.delete()
 		actor.level = None
+		if not self.headless:
+			actor.release_resources()
 
 	def get_actors(self):
 		return self.actors[:]
 
+	def actor_moved(self, actor):
+		"""Called by actors when their position changes, to update the index"""
+		bounds = actor.index_bounds()
+		if bounds is None:
+			x, y = actor.pos
+			self.grid.move(actor, x, y, x, y)
+		else:
+			self.grid.move(actor, bounds.l, bounds.b, bounds.r, bounds.t)
+
+	def actors_in_rect(self, rect, kind=None, margin=0):
+		"""Return the actors (of class kind, if given) indexed near to rect.
+
+		Actors are indexed by position unless they declare index_bounds(), so
+		margin should be the reach of the actors sought from their position.
+		The results are candidates only; callers should test them exactly.
+
+		"""
+		actors = self.grid.query(rect.l - margin, rect.b - margin, rect.r + margin, rect.t + margin)
+		if kind is None:
+			return list(actors)
+		return [a for a in actors if isinstance(a, kind)]
+
+	def actors_within(self, pos, radius, kind=None):
+		"""Return the actors (of class kind, if given) whose positions are
+		within radius of pos."""
+		r2 = radius * radius
+		return [a for a in self.grid.query_radius(pos, radius) if (kind is None or isinstance(a, kind)) and (a.pos - pos).mag2() <= r2]
+
+	def nearest_actor(self, pos, kind=None, distance=None, max_distance=None, filter=None):
+		"""Return the nearest actor to pos (of class kind, if given, and
+		satisfying filter) and the distance to that actor.
+
+		distance is a function of an actor, defaulting to the distance from
+		pos to the actor's position.
+
+		"""
+		if distance is None:
+			distance = lambda a: a.distance_to(pos)
+		if kind is not None:
+			if filter is None:
+				test = lambda a: isinstance(a, kind)
+			else:
+				test = lambda a: isinstance(a, kind) and filter(a)
+		else:
+			test = filter
+		return self.grid.nearest(pos, distance, max_distance=max_distance, filter=test)
+
 	def update_scenery(self):
 		"""Update only scenery objects - for menus"""
 		from bamboo.actors.scenery import Campfire
-		from bamboo.actors.particles import Smoke
 		self.ground.update()
 		for a in self.actors:
-			if isinstance(a, Campfire) or isinstance(a, Smoke):
+			a.save_state()
+			if isinstance(a, Campfire):
 				a.update() 
+		self.update_particles()
 
 	def update(self):
 		"""Run physics, update everything in the world"""
 		from bamboo.actors.characters import Character
-		self.ground.update()
+		from bamboo.actors.base import prefetch_ground
+		with timed('level.update'):
+			self.ground.update()
 
-		for c in self.controllers:
-			c.update()
+			for a in self.actors:
+				a.save_state()
 
-#		self.collide()
+			prefetch_ground(self.actors, self.ground)
 
-		for a in self.actors:
-			if isinstance(a, Character):
-				if a.pos.x < 0:
-					a.pos = Vec2(0, a.pos.y)
-				elif a.pos > self.width:
-					# TODO: fire level completion event
-					pass
-			a.update()
+			with timed('level.controllers'):
+				for c in self.controllers:
+					c.update()
+
+			with timed('level.collide'):
+				self.collide()
+
+			with timed('level.actors'):
+				for a in self.actors:
+					if isinstance(a, Character):
+						if a.pos.x < 0:
+							a.pos = Vec2(0, a.pos.y)
+						elif a.pos > self.width:
+							# TODO: fire level completion event
+							pass
+					a.update()
+
+			self.kill_fallen()
+			self.update_particles()
+			self.time += 1
+
+	def kill_fallen(self):
+		"""Kill actors that have fallen into the void beneath the terrain"""
+		void = self.ground.void_height
+		for a in [a for a in self.actors if a.pos.y <= void]:
+			# an earlier death may have removed it already
+			if a.level is self:
+				a.fall()
+
+	def update_particles(self):
+		for p in self.particle_systems:
+			p.save_state()
+			p.update()
 
 	def collide(self):
-		for i, a in enumerate(self.characters):
-			for b in self.characters[i+1:]:
-				intersection = a.bounds().intersection(b.bounds())
-				if intersection:
-					d = min(intersection.w, intersection.h) # amount of intersection
-					ab = (b.pos - a.pos)
-					if not ab:
-						ab = Vec2(0, 1)
-					v = ab.normalized() # direction AB
-					a.pos -= v
-					b.pos += v
+		"""Notify actors of collisions, via on_collide()"""
+		self.colliders.update()
+		for a, b, abounds, bbounds in self.colliders.pairs():
+			for x, y in ((a, b), (b, a)):
+				# an earlier collision may have killed either actor
+				if x.collides_with & y.collision_mask and x.level is self and y.level is self:
+					x.on_collide(y)
+
+	def collision_stats(self):
+		return self.colliders.stats
 
 	def get_climbables(self):
 		for a in self.climbables:
 			yield a
 
-	def get_nearest_climbable(self, pos):
+	def get_nearest_climbable(self, pos, max_distance=None):
 		"""Return the nearest climbable and the distance to that climbable."""
-		nearest = None
-		distance = None
-		for a in self.get_climbables():
-			d = a.distance_from(pos)
-			if nearest is None or d < distance:
-				nearest = a
-				distance = d
-
-		return nearest, distance
+		from bamboo.actors.trees import Climbable
+		return self.nearest_actor(pos, Climbable, distance=lambda a: a.distance_from(pos), max_distance=max_distance, filter=lambda a: a.is_climbable())
 
 	def find_playercharacters(self):
 		return [a for a in self.characters if a.is_pc]
 
 	def characters_colliding(self, rect):
-		return [a for a in self.characters if a.bounds().intersects(rect)]
-		
+		from bamboo.actors.characters import Character
+		return [a for a in self.actors_in_rect(rect, Character, self.CHARACTER_REACH) if a.bounds().intersects(rect)]
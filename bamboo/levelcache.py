@@ -0,0 +1,237 @@
+"""A cache of compiled levels on disk.
+
+Parsing a level's SVG, tesselating its ground and finding where grass grows
+is slow enough to stall a level transition. The results are saved in a
+compact binary form, keyed by a hash of the SVG source and the cache
+format version, and memory-mapped when the same level is loaded again.
+
+The file is a header followed by a sequence of arrays, each prefixed with
+its typecode and length.
+
+"""
+import os
+import re
+import sys
+import mmap
+import struct
+import hashlib
+from array import array
+
+from bamboo.geom import Vec2, Polygon, PolyLine
+
+
+CACHE_DIR = 'cache/levels'
+
+# Bump this whenever the loader or the file format changes, so that stale
+# compiled levels are ignored
+CACHE_VERSION = 1
+
+MAGIC = 'BWLV'
+HEADER = struct.Struct('=4sHc')
+ARRAY_HEADER = struct.Struct('=cI')
+
+GROUP_KINDS = ['TriangleList', 'TriangleStrip', 'TriangleFan']
+
+
+class LevelCacheError(Exception):
+	"""A compiled level could not be read"""
+
+
+class CompiledLevel(object):
+	"""The parts of a level that are expensive to compute from the SVG."""
+	def __init__(self, width, height, polygon, render_groups, grass_polylines, spawns):
+		self.width = width
+		self.height = height
+		self.polygon = polygon
+		self.render_groups = render_groups
+		self.grass_polylines = grass_polylines
+		self.spawns = spawns	# list of (name, Vec2)
+
+
+def flatten(vertices, out):
+	for v in vertices:
+		out.append(v.x)
+		out.append(v.y)
+
+
+def unflatten(coords, start, count):
+	return [Vec2(coords[i], coords[i + 1]) for i in xrange(start, start + count * 2, 2)]
+
+
+class LevelCache(object):
+	def __init__(self, path=CACHE_DIR):
+		self.path = path
+
+	def key(self, source, tesselator):
+		"""Compute the cache key for the SVG source of a level"""
+		h = hashlib.sha1(source)
+		h.update('\0%d\0%s' % (CACHE_VERSION, tesselator))
+		return h.hexdigest()
+
+	def current_keys(self, source):
+		"""Return the cache keys for the SVG source with every tesselator"""
+		return [self.key(source, t) for t in Polygon.TESSELATORS]
+
+	def basename(self, name):
+		return os.path.splitext(os.path.basename(name))[0]
+
+	def filename(self, name, key):
+		return os.path.join(self.path, '%s-%s.lvl' % (self.basename(name), key))
+
+	def cached_keys(self, name):
+		"""Return the keys of the compiled versions of a level in the cache"""
+		owned = re.compile(r'^%s-([0-9a-f]{40})\.lvl$' % re.escape(self.basename(name)))
+		keys = []
+		for f in os.listdir(self.path):
+			m = owned.match(f)
+			if m:
+				keys.append(m.group(1))
+		return keys
+
+	def load(self, name, key):
+		"""Load a compiled level, or return None if it is not cached."""
+		fname = self.filename(name, key)
+		try:
+			f = open(fname, 'rb')
+		except IOError:
+			return None
+		try:
+			try:
+				m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (mmap.error, ValueError):
+				return None
+			try:
+				return self.read(m)
+			except (LevelCacheError, struct.error):
+				return None
+			finally:
+				m.close()
+		finally:
+			f.close()
+
+	def save(self, name, key, compiled, current=()):
+		"""Write a compiled level to the cache.
+
+		Other compiled versions of the level are removed, unless their keys
+		are in current (see current_keys()).
+
+		Failure to write is ignored; the level will just be compiled again.
+		"""
+		fname = self.filename(name, key)
+		tmpname = '%s.%d.tmp' % (fname, os.getpid())
+		try:
+			if not os.path.isdir(self.path):
+				os.makedirs(self.path)
+			f = open(tmpname, 'wb')
+			try:
+				self.write(f, compiled)
+			finally:
+				f.close()
+			# discard compiled versions of the level that are now stale
+			for k in self.cached_keys(name):
+				if k != key and k not in current:
+					os.remove(self.filename(name, k))
+			os.rename(tmpname, fname)
+		except (IOError, OSError):
+			try:
+				os.remove(tmpname)
+			except OSError:
+				pass
+
+	def write_array(self, f, a):
+		f.write(ARRAY_HEADER.pack(a.typecode, len(a)))
+		f.write(a.tostring())
+
+	def read_array(self, m, offset, typecode):
+		code, count = ARRAY_HEADER.unpack_from(m, offset)
+		if code != typecode:
+			raise LevelCacheError("Expected array of %r, found %r" % (typecode, code))
+		offset += ARRAY_HEADER.size
+		a = array(typecode)
+		end = offset + count * a.itemsize
+		if end > len(m):
+			raise LevelCacheError("Truncated compiled level")
+		a.fromstring(m[offset:end])
+		return a, end
+
+	def write(self, f, compiled):
+		f.write(HEADER.pack(MAGIC, CACHE_VERSION, sys.byteorder[0]))
+
+		self.write_array(f, array('d', [compiled.width, compiled.height]))
+
+		lengths = array('i')
+		coords = array('d')
+		for c in compiled.polygon.contours:
+			lengths.append(len(c))
+			flatten(c, coords)
+		self.write_array(f, lengths)
+		self.write_array(f, coords)
+
+		kinds = array('b')
+		lengths = array('i')
+		coords = array('d')
+		for g in compiled.render_groups:
+			kinds.append(GROUP_KINDS.index(g.__class__.__name__))
+			lengths.append(len(g.vertices))
+			flatten(g.vertices, coords)
+		self.write_array(f, kinds)
+		self.write_array(f, lengths)
+		self.write_array(f, coords)
+
+		lengths = array('i')
+		coords = array('d')
+		for pl in compiled.grass_polylines:
+			lengths.append(len(pl.vertices))
+			flatten(pl.vertices, coords)
+		self.write_array(f, lengths)
+		self.write_array(f, coords)
+
+		names = array('c', '\n'.join(name for name, pos in compiled.spawns))
+		coords = array('d')
+		flatten((pos for name, pos in compiled.spawns), coords)
+		self.write_array(f, names)
+		self.write_array(f, coords)
+
+	def read(self, m):
+		from bamboo import geom
+
+		magic, version, byteorder = HEADER.unpack_from(m, 0)
+		if magic != MAGIC or version != CACHE_VERSION or byteorder != sys.byteorder[0]:
+			raise LevelCacheError("Compiled level is from a different version")
+		off = HEADER.size
+
+		size, off = self.read_array(m, off, 'd')
+		width, height = size
+
+		polygon = Polygon()
+		lengths, off = self.read_array(m, off, 'i')
+		coords, off = self.read_array(m, off, 'd')
+		i = 0
+		for n in lengths:
+			polygon.add_contour(unflatten(coords, i, n))
+			i += n * 2
+
+		render_groups = []
+		kinds, off = self.read_array(m, off, 'b')
+		lengths, off = self.read_array(m, off, 'i')
+		coords, off = self.read_array(m, off, 'd')
+		i = 0
+		for kind, n in zip(kinds, lengths):
+			cls = getattr(geom, GROUP_KINDS[kind])
+			render_groups.append(cls(unflatten(coords, i, n)))
+			i += n * 2
+
+		grass_polylines = []
+		lengths, off = self.read_array(m, off, 'i')
+		coords, off = self.read_array(m, off, 'd')
+		i = 0
+		for n in lengths:
+			grass_polylines.append(PolyLine(unflatten(coords, i, n)))
+			i += n * 2
+
+		names, off = self.read_array(m, off, 'c')
+		coords, off = self.read_array(m, off, 'd')
+		names = names.tostring().split('\n') if names else []
+		spawns = zip(names, unflatten(coords, 0, len(names)))
+
+		return CompiledLevel(int(width), int(height), polygon, render_groups, grass_polylines, spawns)
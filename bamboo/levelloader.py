@@ -1,4 +1,5 @@
 import re
+from cStringIO import StringIO
 from xml.etree import ElementTree
 
 import pyglet
@@ -6,6 +7,7 @@ import pyglet
 from bamboo.geom import Vec2, Polygon, Plane
 from bamboo.level import Level, ActorSpawn
 from bamboo.terrain import Terrain
+from bamboo.levelcache import LevelCache, CompiledLevel
 
 SVG_NS = 'http://www.w3.org/2000/svg'
 INKSCAPE_NS = 'http://www.inkscape.org/namespaces/inkscape'
@@ -17,10 +19,34 @@ class LevelParseError(Exception):
 
 
 class SVGLevelLoader(object):
-	"""Constructs a level from an SVG file constructed with Inkscape"""
+	"""Constructs a level from an SVG file constructed with Inkscape.
+
+	Compiled levels are cached on disk unless cache is False.
+	"""
+	def __init__(self, tesselator='glu', cache=True):
+		self.tesselator = tesselator
+		self.cache = LevelCache() if cache else None
+
 	def load(self, svgfile):
 		file = pyglet.resource.file(svgfile)
-		doc = ElementTree.parse(file)
+		try:
+			source = file.read()
+		finally:
+			file.close()
+
+		if self.cache is not None:
+			key = self.cache.key(source, self.tesselator)
+			compiled = self.cache.load(svgfile, key)
+			if compiled is not None:
+				return self.load_compiled(compiled)
+
+		level = self.load_source(source, svgfile)
+		if self.cache is not None:
+			self.cache.save(svgfile, key, self.compile(level), self.cache.current_keys(source))
+		return level
+
+	def load_source(self, source, svgfile):
+		doc = ElementTree.parse(StringIO(source))
 		self.width = int(float(doc.getroot().get('width')))
 		self.height = int(float(doc.getroot().get('height')))
 		for g in doc.findall('./{%s}g' % SVG_NS):
@@ -28,6 +54,20 @@ class SVGLevelLoader(object):
 				return self.load_from_group(g)
 		raise ValueError("No level found in " + svgfile)
 
+	def compile(self, level):
+		"""Compute everything about a level that is worth caching"""
+		t = level.ground
+		return CompiledLevel(level.width, level.height, t.polygon,
+			t.get_render_groups(), t.get_grass_polylines(),
+			[(s.name, s.pos) for s in level.actor_spawns])
+
+	def load_compiled(self, compiled):
+		t = Terrain(compiled.polygon, tesselator=self.tesselator)
+		t.render_groups = compiled.render_groups
+		t.grass_polylines = compiled.grass_polylines
+		spawnpoints = [ActorSpawn(name, pos) for name, pos in compiled.spawns]
+		return Level(compiled.width, compiled.height, ground=t, actor_spawns=spawnpoints)
+
 	def load_from_group(self, g):
 		spawnpoints = []
 		terrain = None
@@ -46,7 +86,7 @@ class SVGLevelLoader(object):
 		return Level(self.width, self.height, ground=terrain, actor_spawns=spawnpoints)
 
 	def load_terrain(self, heightmap):
-		t = Terrain(heightmap)
+		t = Terrain(heightmap, tesselator=self.tesselator)
 		return t
 
 	def load_object(self, use):
@@ -110,13 +110,18 @@ class MenuGameState(GameState):
 	def start(self):
 		pass
 
+	def stop(self):
+		if self.child:
+			self.child.stop()
+
 	def set_menu(self, menu):
 		menu.load_resources()
 		menu.create_batch(self.game.window)	
 		self.menu = menu
 
 	def update(self, keys):
-		pass
+		if self.child:
+			self.child.update_paused()
 
 	def on_key_press(self, code, modifiers):
 		if code == key.UP:
@@ -126,9 +131,9 @@ class MenuGameState(GameState):
 		elif code == key.ENTER:
 			self.menu.select_option()
 
-	def draw(self):
+	def draw(self, alpha=1.0):
 		if self.child:
-			self.child.draw()
+			self.child.draw(alpha)
 		self.menu.draw()	
 
 
@@ -0,0 +1,103 @@
+"""Particles stored as parallel arrays rather than as actors.
+
+Each particle is a row across a set of arrays (position, velocity, rotation,
+scale, age...), so updating them all is one loop over flat arrays of floats
+rather than a method call and several Vec2 allocations per particle. Dead
+particles are removed by moving the last particle into their row.
+
+"""
+from array import array
+
+
+class ParticleSystem(object):
+	"""A pool of particles that share a texture and simple physics.
+
+	Subclasses set the texture and the constants of motion: each frame a
+	particle's velocity has GRAVITY added and is multiplied by DAMPING, its
+	scale grows by GROWTH, and it fades out over its lifetime.
+
+	"""
+	TEXTURE = None			# resource name of the particle image
+	LAYER = 6			# ordered group to draw in
+	GRAVITY = (0.0, 0.0)
+	DAMPING = 1.0
+	GROWTH = 0.0
+	CAPACITY = 4096			# most particles alive at once
+
+	COLUMNS = ['x', 'y', 'prev_x', 'prev_y', 'vx', 'vy', 'rotation', 'spin', 'scale', 'age', 'lifetime', 'flip']
+
+	def __init__(self):
+		self.clear()
+
+	def __len__(self):
+		return self.count
+
+	def clear(self):
+		self.count = 0
+		for c in self.COLUMNS:
+			setattr(self, c, array('f'))
+
+	def emit(self, x, y, vx=0.0, vy=0.0, rotation=0.0, spin=0.0, scale=1.0, lifetime=30, flip=False):
+		"""Add a particle. If the system is full, the particle is dropped."""
+		if self.count >= self.CAPACITY:
+			return
+		self.x.append(x)
+		self.y.append(y)
+		self.prev_x.append(x)
+		self.prev_y.append(y)
+		self.vx.append(vx)
+		self.vy.append(vy)
+		self.rotation.append(rotation)
+		self.spin.append(spin)
+		self.scale.append(scale)
+		self.age.append(0)
+		self.lifetime.append(lifetime)
+		self.flip.append(-1.0 if flip else 1.0)
+		self.count += 1
+
+	def remove(self, i):
+		"""Remove particle i, by moving the last particle into its place"""
+		last = self.count - 1
+		for c in self.COLUMNS:
+			col = getattr(self, c)
+			col[i] = col[last]
+			col.pop()
+		self.count = last
+
+	def save_state(self):
+		"""Record positions to interpolate from when drawing"""
+		self.prev_x = array('f', self.x)
+		self.prev_y = array('f', self.y)
+
+	def update(self):
+		"""Advance every particle by one frame"""
+		gx, gy = self.GRAVITY
+		damping = self.DAMPING
+		growth = self.GROWTH
+		x = self.x
+		y = self.y
+		vx = self.vx
+		vy = self.vy
+		rotation = self.rotation
+		spin = self.spin
+		scale = self.scale
+		age = self.age
+		lifetime = self.lifetime
+
+		i = self.count - 1
+		while i >= 0:
+			a = age[i] + 1
+			if a >= lifetime[i]:
+				self.remove(i)
+				i -= 1
+				continue
+			age[i] = a
+			dx = (vx[i] + gx) * damping
+			dy = (vy[i] + gy) * damping
+			vx[i] = dx
+			vy[i] = dy
+			x[i] += dx
+			y[i] += dy
+			rotation[i] += spin[i]
+			scale[i] += growth
+			i -= 1
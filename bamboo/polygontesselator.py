@@ -4,7 +4,7 @@ import itertools
 from ctypes import CFUNCTYPE, POINTER, byref, cast, pointer
 from pyglet.gl import *
 
-from bamboo.geom import Vec2, ConvexPolygon
+from bamboo.geom import Vec2, TriangleStrip, TriangleFan, TriangleList
 
 """Polygon Tesselator.
 
@@ -70,58 +70,6 @@ class PolygonTesselationError(Exception):
 	"""Python wrapper for a GLU tesselation error"""
 
 
-class TriangleStrip(object):
-	def __init__(self, vertices):
-		self.vertices = vertices
-
-	def triangles(self):
-		vs = self.vertices[:]
-		p1 = vs.pop(0)
-		p2 = vs.pop(0)
-		while vs: 
-			p3 = vs.pop(0)
-			yield ConvexPolygon([p1, p2, p3])
-			p1 = p2
-			p2 = p3
-
-	def gl_vertices(self):
-		return GL_TRIANGLE_STRIP, self.vertices
-
-
-class TriangleFan(object):
-	def __init__(self, vertices):
-		self.vertices = vertices
-
-	def triangles(self):
-		vs = self.vertices[:]
-		c = vs.pop(0)
-		p2 = vs.pop(0)
-		while vs:
-			p3 = vs.pop(0)
-			yield ConvexPolygon([c, p2, p3])
-			p2 = p3
-
-	def gl_vertices(self):
-		vs = []
-		for t in self.triangles():
-			vs += reversed(t.vertices)
-		return GL_TRIANGLES, vs
-
-
-class TriangleList(object):
-	def __init__(self, vertices):
-		self.vertices = vertices
-
-	def triangles(self):
-		vs = self.vertices[:]
-		while vs:
-			yield ConvexPolygon(vs[:3])
-			vs = vs[3:]
-	
-	def gl_vertices(self):
-		return GL_TRIANGLES, self.vertices
-
-
 class PolygonTesselator(object):
 	"""Splits Polygons into a list of ConvexPolygons.
 
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+
+class ActorPool(object):
+	"""Recycles dead actors of one class, along with their sprites.
+
+	Particles are spawned and killed by the dozen, and creating and deleting
+	their sprites churns the batch. Instead, a killed actor's sprite is
+	hidden, and the actor is kept to be reset() and spawned again. At most
+	size actors are alive at once; beyond that the oldest is killed to make
+	room for the new one.
+
+	"""
+	def __init__(self, cls, size):
+		self.cls = cls
+		self.size = size
+		self.live = OrderedDict()	# oldest first
+		self.free = []
+
+	def __len__(self):
+		return len(self.live)
+
+	def acquire(self, level, *args, **kwargs):
+		"""Return an actor ready to be spawned into level, constructed or
+		reset with the given arguments."""
+		if len(self.live) >= self.size:
+			oldest = next(iter(self.live))
+			level.kill(oldest)
+
+		if self.free:
+			actor = self.free.pop()
+			# the sprite stays hidden until the scene shows it on screen
+			actor.reset(*args, **kwargs)
+		else:
+			actor = self.cls(*args, **kwargs)
+		actor.pool = self
+		self.live[actor] = True
+		return actor
+
+	def release(self, actor):
+		"""Take back an actor that has been killed"""
+		del self.live[actor]
+		if actor.sprite is not None:
+			actor.sprite.visible = False
+		self.free.append(actor)
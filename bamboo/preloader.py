@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import threading
+
+
+class LevelPreloader(object):
+	"""Loads levels on worker threads, ahead of when they are needed.
+
+	Everything that doesn't need GL - parsing the SVG, decoding the ground
+	path, tesselation and finding the grass - is done on the worker, so it
+	uses a tesselator that doesn't need a GL context.
+
+	"""
+	def __init__(self, tesselator='earclip'):
+		self.tesselator = tesselator
+		self.pending = {}
+
+	def load(self, name):
+		from bamboo.levelloader import SVGLevelLoader
+		level = SVGLevelLoader(tesselator=self.tesselator).load(name)
+		# compute everything the renderer will ask for
+		level.ground.get_render_groups()
+		level.ground.get_grass_polylines()
+		return level
+
+	def request(self, name):
+		"""Start loading a level in the background"""
+		if name in self.pending:
+			return
+		result = {}
+
+		def run():
+			try:
+				result['level'] = self.load(name)
+			except Exception:
+				result['error'] = sys.exc_info()
+
+		t = threading.Thread(target=run, name='preload ' + name)
+		t.daemon = True
+		self.pending[name] = (t, result)
+		t.start()
+
+	def ready(self, name):
+		"""Return True if a level that was requested has finished loading"""
+		try:
+			t, result = self.pending[name]
+		except KeyError:
+			return False
+		return not t.is_alive()
+
+	def get(self, name):
+		"""Return the loaded level, waiting for it if it isn't ready yet.
+
+		A level that was never requested is loaded immediately.
+		"""
+		try:
+			t, result = self.pending.pop(name)
+		except KeyError:
+			return self.load(name)
+		t.join()
+		if 'error' in result:
+			cls, exc, tb = result['error']
+			raise cls, exc, tb
+		return result['level']
+
+
+RESOURCE_WORKERS = 4
+
+
+class ResourcePreloader(object):
+	"""Loads the resources of many classes at once, before play begins.
+
+	Classes load their resources when the first actor of each is spawned,
+	so the first blood spray or corpse would stall the game while its images
+	are decoded. Instead the resources the classes will load are listed,
+	images, textures and sounds are decoded (and the sprite atlas read) on a
+	pool of worker threads, and then each class is loaded on the main
+	thread, which only has to upload what was decoded.
+
+	"""
+	def __init__(self, workers=RESOURCE_WORKERS):
+		self.workers = workers
+		self.classes = []
+
+	def add(self, *classes):
+		"""Add classes to load, along with their superclasses"""
+		from bamboo.resources import resource_classes
+		for cls in classes:
+			for c in reversed(resource_classes(cls)):
+				if c not in self.classes and not c.__dict__.get('_resources_loaded'):
+					self.classes.append(c)
+
+	def decode(self, job):
+		"""Run on a worker: decode a resource, or read the atlas.
+
+		Returns the job, the result, the exception if it failed, and the
+		time taken. A resource that failed is then loaded as usual, and
+		fails there.
+		"""
+		from bamboo import resources
+		start = time.time()
+		result = error = None
+		try:
+			if job == 'atlas':
+				from bamboo.atlas import SpriteAtlas
+				result = SpriteAtlas().read()
+			else:
+				resources.decode(*job)
+		except Exception, e:
+			error = e
+		return job, result, error, time.time() - start
+
+	def load(self):
+		"""Load the resources of every class added.
+
+		Returns a list of (name, seconds decoding, seconds loading) for the
+		sprite atlas and each class.
+		"""
+		from multiprocessing.pool import ThreadPool
+		from bamboo import resources
+		from bamboo.atlas import SpriteAtlas
+
+		sprites = set(os.path.basename(f) for f in SpriteAtlas().sprite_files())
+		owners = {}
+		jobs = []
+		for c in self.classes:
+			for kind, name in c.list_resources():
+				if kind == 'image' and name in sprites:
+					if not resources.atlas_loaded() and 'atlas' not in owners:
+						owners['atlas'] = None
+						jobs.insert(0, 'atlas')
+				elif (kind, name) not in owners:
+					owners[kind, name] = c
+					jobs.append((kind, name))
+
+		decoding = {}
+		packed = None
+		if jobs:
+			pool = ThreadPool(self.workers)
+			try:
+				for job, result, error, elapsed in pool.imap_unordered(self.decode, jobs):
+					if error is not None:
+						what = 'the sprite atlas' if job == 'atlas' else job[1]
+						print "Couldn't preload %s, loading it on the main thread: %s" % (what, error)
+					if job == 'atlas':
+						packed = result
+					owner = owners[job]
+					decoding[owner] = decoding.get(owner, 0.0) + elapsed
+			finally:
+				pool.close()
+				pool.join()
+
+		times = []
+		if 'atlas' in owners:
+			start = time.time()
+			resources.load_atlas(packed)
+			times.append(('sprite atlas', decoding[None], time.time() - start))
+		for c in self.classes:
+			start = time.time()
+			c.load_resources()
+			times.append((c.__name__, decoding.get(c, 0.0), time.time() - start))
+		self.classes = []
+		return times
+
+	def report(self, times):
+		"""Print the times returned by load(), slowest first"""
+		for name, decoding, loading in sorted(times, key=lambda t: -t[1] - t[2]):
+			print "  %-24s %6.1fms decoding, %6.1fms loading" % (name, decoding * 1000, loading * 1000)
@@ -0,0 +1,142 @@
+import math
+
+import pyglet
+from pyglet.gl import *
+
+
+class ParticleList(object):
+	"""A growable vertex list of quads for all the particles sharing one
+	texture and layer.
+
+	The list only ever grows, doubling in size, so that the batch doesn't
+	have to reallocate as particles come and go; quads beyond the number
+	drawn are collapsed to a point. Texture coordinates are the same for
+	every quad (flipped particles are mirrored in their vertices instead),
+	so they are only written when the list grows.
+
+	"""
+	INITIAL_CAPACITY = 64
+
+	def __init__(self, batch, texture, layer):
+		self.batch = batch
+		self.texture = texture
+		self.group = pyglet.sprite.SpriteGroup(texture, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA,
+			parent=pyglet.graphics.OrderedGroup(layer))
+		self.vertex_list = None
+		self.capacity = 0
+		self.count = 0
+
+	def reserve(self, n):
+		"""Ensure the list has room for n quads"""
+		if n <= self.capacity:
+			return
+		capacity = max(self.capacity, self.INITIAL_CAPACITY)
+		while capacity < n:
+			capacity *= 2
+
+		if self.vertex_list is None:
+			self.vertex_list = self.batch.add(capacity * 4, GL_QUADS, self.group, 'v2f/stream', 't2f/static', 'c4B/stream')
+		else:
+			self.vertex_list.resize(capacity * 4)
+
+		tc = self.texture.tex_coords
+		u0, v0, u1, v1 = tc[0], tc[1], tc[6], tc[7]
+		vl = self.vertex_list
+		vl.tex_coords[:] = [u0, v0, u1, v0, u1, v1, u0, v1] * capacity
+		vl.vertices[self.count * 8:] = [0.0] * ((capacity - self.count) * 8)
+		self.capacity = capacity
+
+	def write(self, vertices, colours):
+		"""Replace the quads drawn with the given flat lists of coordinates
+		and colours, four vertices per quad."""
+		n = len(vertices) // 8
+		if n == 0 and self.vertex_list is None:
+			return
+		self.reserve(n)
+		vl = self.vertex_list
+		vl.vertices[:n * 8] = vertices
+		vl.colors[:n * 16] = colours
+		if n < self.count:
+			# collapse quads that are no longer used
+			vl.vertices[n * 8:self.count * 8] = [0.0] * ((self.count - n) * 8)
+		self.count = n
+
+	def delete(self):
+		if self.vertex_list is not None:
+			self.vertex_list.delete()
+			self.vertex_list = None
+
+
+class ParticleRenderer(object):
+	"""Draws ParticleSystems into a batch, with one ParticleList per texture
+	rather than a Sprite per particle."""
+	def __init__(self, systems, batch):
+		self.systems = systems
+		self.batch = batch
+		self.lists = {}
+
+	def get_list(self, system):
+		key = (system.TEXTURE, system.LAYER)
+		try:
+			return self.lists[key]
+		except KeyError:
+			tex = pyglet.resource.texture(system.TEXTURE)
+			l = self.lists[key] = ParticleList(self.batch, tex, system.LAYER)
+			return l
+
+	def update(self, alpha=1.0):
+		"""Write the particles' current quads into the batch"""
+		quads = {}
+		for system in self.systems:
+			l = self.get_list(system)
+			try:
+				vertices, colours = quads[l]
+			except KeyError:
+				vertices, colours = quads[l] = ([], [])
+			self.compute_quads(system, l.texture, alpha, vertices, colours)
+
+		for l, (vertices, colours) in quads.iteritems():
+			l.write(vertices, colours)
+
+	def compute_quads(self, system, texture, alpha, vertices, colours):
+		"""Append the corners and colours of each particle's quad"""
+		hw = texture.width * 0.5
+		hh = texture.height * 0.5
+		radians = -math.pi / 180.0
+		cos = math.cos
+		sin = math.sin
+		extend = vertices.extend
+		extend_colours = colours.extend
+
+		xs = system.x
+		ys = system.y
+		pxs = system.prev_x
+		pys = system.prev_y
+		rotation = system.rotation
+		scale = system.scale
+		flip = system.flip
+		age = system.age
+		lifetime = system.lifetime
+		for i in xrange(system.count):
+			px = pxs[i]
+			py = pys[i]
+			x = px + (xs[i] - px) * alpha
+			y = py + (ys[i] - py) * alpha
+			s = scale[i]
+			r = rotation[i] * radians
+			cr = cos(r) * s
+			sr = sin(r) * s
+			# corners (-hw, -hh), (hw, -hh), (hw, hh), (-hw, hh), rotated and
+			# scaled; a negative flip mirrors the quad horizontally
+			f = flip[i]
+			ax = hw * cr * f
+			ay = hw * sr * f
+			bx = hh * sr
+			by = hh * cr
+			extend((
+				x - ax + bx, y - ay - by,
+				x + ax + bx, y + ay - by,
+				x + ax - bx, y + ay + by,
+				x - ax - bx, y - ay + by))
+			o = 255 - int(age[i] / lifetime[i] * 255)
+			extend_colours((255, 255, 255, o, 255, 255, 255, o, 255, 255, 255, o, 255, 255, 255, o))
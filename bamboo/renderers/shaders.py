@@ -0,0 +1,230 @@
+"""GLSL programs that animate geometry on the GPU.
+
+Swaying trees and grass can be drawn from static vertex data, with a vertex
+shader applying the wind, rather than rewriting their vertices every frame.
+Everything here is optional: get_program() returns None if shaders are
+disabled, the GL version is below 2.0 or a program fails to compile, and
+callers then fall back to animating vertices on the CPU.
+
+The shaders are GLSL 1.20 using the fixed function matrices and colour, so
+they also run under Mesa's software rasteriser (LIBGL_ALWAYS_SOFTWARE=1).
+tests/test_shaders.py draws trees and grass with them offscreen and checks
+that they match the CPU path.
+
+"""
+import ctypes
+
+import pyglet
+from pyglet.gl import *
+
+
+enabled = True		# set to False to always use the CPU fallbacks
+
+# Generic attribute indices. Some drivers (NVIDIA's) alias the built-in
+# attributes to generic ones: 0 is gl_Vertex, 2 gl_Normal, 3 gl_Color, 4 and
+# 5 the secondary and fog colours and 8 to 15 gl_MultiTexCoord0 to 7. The
+# shaders read gl_Vertex, gl_Color and gl_MultiTexCoord0, so these indices
+# are clear of those and of the other colours and the normal.
+SWAY_ATTRIBUTE = 6	# generic attribute index carrying per-vertex sway data
+BASE_ATTRIBUTE = 7	# the base of the tree a vertex belongs to
+WIND_ATTRIBUTE = 10	# how the wind bends that tree (see BambooTree.sway_wind())
+
+# The usage of the generic attributes in vertex lists. Since pyglet 1.2 a
+# vertex domain lists its static attributes twice, and then refuses a
+# static generic attribute as a duplicate of itself, so these are dynamic
+# even though they are only written when the vertex list is created.
+GENERIC_USAGE = 'dynamic'
+
+
+TEXTURED_FRAGMENT_SHADER = """
+#version 120
+uniform sampler2D tex;
+
+void main() {
+	gl_FragColor = texture2D(tex, gl_TexCoord[0].st) * gl_Color;
+}
+"""
+
+# Positions a vertex of a bamboo tree. segment is the index of the node the
+# vertex belongs to, the side of the trunk it is on (0, 1 or 2, for left,
+# centre and right), and the radius and base angle of its tree; the vertex
+# position is an offset from that point which is rotated with the segment,
+# used for the corners of leaves. The tree's wobble per segment is computed
+# from the level time like BambooTree.update() does, from the wind phase at
+# time 0, the phase per update, and a still and a swaying part of the
+# wobble. Everything that differs between trees is in attributes, so that
+# all trees can be drawn with the same uniforms.
+TREE_VERTEX_SHADER = """
+#version 120
+uniform float piece_height;
+uniform float thinning;
+uniform float time;
+attribute vec4 segment;
+attribute vec2 base;
+attribute vec4 wind;
+
+vec2 up(float a) {
+	return vec2(-sin(a), cos(a));
+}
+
+void main() {
+	float i = segment.x;
+	float radius = segment.z;
+	float base_angle = segment.w;
+	float phase = wind.x + time * wind.y;
+	float da = wind.z + wind.w * (0.4 * sin(phase) + 0.2 * sin(phase * 0.21));
+	float a = base_angle + i * da;
+
+	// the sum of the directions of the segments below this node
+	float n = i;
+	if (abs(da) > 1e-5) {
+		n = sin(i * da * 0.5) / sin(da * 0.5);
+	}
+	vec2 node = base + piece_height * n * up(base_angle + (i - 1.0) * da * 0.5);
+
+	vec2 side = (segment.y - 1.0) * radius * pow(thinning, i) * vec2(cos(a), sin(a));
+
+	float r = i * da;
+	vec2 v = gl_Vertex.xy;
+	vec2 offset = vec2(v.x * cos(r) - v.y * sin(r), v.x * sin(r) + v.y * cos(r));
+
+	gl_Position = gl_ModelViewProjectionMatrix * vec4(node + side + offset, 0.0, 1.0);
+	gl_TexCoord[0] = gl_MultiTexCoord0;
+	gl_FrontColor = gl_Color;
+}
+"""
+
+# Sways a vertex of a grass strip horizontally by sway times the wind
+# displacement at its x coordinate (see GrassStrip.update()).
+GRASS_VERTEX_SHADER = """
+#version 120
+uniform float wind_phase;
+attribute float sway;
+
+void main() {
+	vec2 v = gl_Vertex.xy;
+	float u = v.x / 128.0 * 0.5;
+	float dx = 4.0 * sin(wind_phase + u) + 3.0 * sin(wind_phase * 0.375 + u);
+	v.x += dx * sway;
+
+	gl_Position = gl_ModelViewProjectionMatrix * vec4(v, 0.0, 1.0);
+	gl_TexCoord[0] = gl_MultiTexCoord0;
+	gl_FrontColor = gl_Color;
+}
+"""
+
+PROGRAMS = {
+	'tree': (TREE_VERTEX_SHADER, TEXTURED_FRAGMENT_SHADER, {'segment': SWAY_ATTRIBUTE, 'base': BASE_ATTRIBUTE, 'wind': WIND_ATTRIBUTE}),
+	'grass': (GRASS_VERTEX_SHADER, TEXTURED_FRAGMENT_SHADER, {'sway': SWAY_ATTRIBUTE}),
+}
+
+
+class ShaderError(Exception):
+	"""A shader failed to compile or link"""
+
+
+def c_string(s):
+	return ctypes.cast(ctypes.create_string_buffer(s), ctypes.POINTER(GLchar))
+
+
+def compile_shader(kind, source):
+	shader = glCreateShader(kind)
+	src = ctypes.c_char_p(source)
+	glShaderSource(shader, 1, ctypes.cast(ctypes.pointer(src), ctypes.POINTER(ctypes.POINTER(GLchar))), None)
+	glCompileShader(shader)
+
+	status = GLint()
+	glGetShaderiv(shader, GL_COMPILE_STATUS, ctypes.byref(status))
+	if not status.value:
+		length = GLint()
+		glGetShaderiv(shader, GL_INFO_LOG_LENGTH, ctypes.byref(length))
+		log = ctypes.create_string_buffer(max(length.value, 1))
+		glGetShaderInfoLog(shader, len(log), None, log)
+		glDeleteShader(shader)
+		raise ShaderError(log.value)
+	return shader
+
+
+class ShaderProgram(object):
+	"""A linked vertex and fragment shader.
+
+	attributes maps the names of vertex attributes to the generic attribute
+	indices they are bound to, which must match those used in vertex list
+	formats (eg. '1g2f' for index 1).
+
+	"""
+	def __init__(self, vertex_source, fragment_source, attributes={}):
+		self.id = glCreateProgram()
+		for kind, source in [(GL_VERTEX_SHADER, vertex_source), (GL_FRAGMENT_SHADER, fragment_source)]:
+			glAttachShader(self.id, compile_shader(kind, source))
+		for name, index in attributes.items():
+			glBindAttribLocation(self.id, index, c_string(name))
+		glLinkProgram(self.id)
+
+		status = GLint()
+		glGetProgramiv(self.id, GL_LINK_STATUS, ctypes.byref(status))
+		if not status.value:
+			length = GLint()
+			glGetProgramiv(self.id, GL_INFO_LOG_LENGTH, ctypes.byref(length))
+			log = ctypes.create_string_buffer(max(length.value, 1))
+			glGetProgramInfoLog(self.id, len(log), None, log)
+			raise ShaderError(log.value)
+		self.uniforms = {}
+
+	def use(self):
+		glUseProgram(self.id)
+
+	def stop(self):
+		glUseProgram(0)
+
+	def set_uniform(self, name, *values):
+		"""Set a float, vec2, vec3 or vec4 uniform. The program must be in use."""
+		try:
+			loc = self.uniforms[name]
+		except KeyError:
+			loc = self.uniforms[name] = glGetUniformLocation(self.id, c_string(name))
+		[glUniform1f, glUniform2f, glUniform3f, glUniform4f][len(values) - 1](loc, *values)
+
+
+_programs = {}
+
+def get_program(name):
+	"""Return the named ShaderProgram, or None if shaders can't be used.
+
+	A GL context must be current. Programs are compiled on first use.
+	"""
+	if not enabled:
+		return None
+	try:
+		return _programs[name]
+	except KeyError:
+		pass
+
+	program = None
+	if pyglet.gl.gl_info.have_version(2, 0):
+		try:
+			program = ShaderProgram(*PROGRAMS[name])
+		except ShaderError, e:
+			print "Couldn't compile %s shader, animating on the CPU:\n%s" % (name, e)
+	_programs[name] = program
+	return program
+
+
+class ShaderGroup(pyglet.graphics.Group):
+	"""A group that draws its children with a shader program.
+
+	Subclasses set the program's uniforms in set_uniforms().
+	"""
+	def __init__(self, program, parent=None):
+		super(ShaderGroup, self).__init__(parent)
+		self.program = program
+
+	def set_uniforms(self):
+		pass
+
+	def set_state(self):
+		self.program.use()
+		self.set_uniforms()
+
+	def unset_state(self):
+		self.program.stop()
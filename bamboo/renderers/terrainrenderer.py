@@ -1,11 +1,13 @@
 import math
+from array import array
 
 import pyglet
 from pyglet.gl import *
 
-from bamboo.geom import Vec2
+from bamboo.geom import Rect, PolyLine
 from bamboo.resources import ResourceTracker
 from bamboo.renderers import pad_coord_list
+from bamboo.renderers import shaders
 
 
 class TerrainGroup(pyglet.graphics.Group):
@@ -52,16 +54,42 @@ class TerrainGroup(pyglet.graphics.Group):
 		glDisable(GL_TEXTURE_GEN_T)
 
 
+class GrassSwayGroup(shaders.ShaderGroup):
+	"""Draws grass swaying with a TerrainRenderer's wind phase, in the
+	'grass' shader program."""
+	def __init__(self, program, renderer, parent=None):
+		super(GrassSwayGroup, self).__init__(program, parent)
+		self.renderer = renderer
+
+	def set_uniforms(self):
+		self.program.set_uniform('wind_phase', self.renderer.wind_phase)
+
+
 class GrassStrip(ResourceTracker):
-	"""A strip of grass"""
+	"""A strip of grass.
+
+	The grass at x is displaced by 4 sin(p + u) + 3 sin(0.375p + u), where
+	p is the wind phase and u = x / 256. Expanding the sines, that is
+	sin(u) * C + cos(u) * S where C and S depend only on p, so sin(u) and
+	cos(u) are computed once per vertex and the sway is then two multiplies
+	per vertex per frame.
+
+	"""
+	SWAY = 7	# furthest the grass sways either way
+
 	def __init__(self, polyline):
 		self.polyline = polyline
+		self.swaying = False	# True if the grass is animated by a shader
+		self.wind_phase = None	# the phase the vertices were last computed for
+		self.bounds = None	# set when added to a batch
 
 	@classmethod
 	def on_class_load(cls):
 		cls.load_texture('grass', 'grass.png')
 
-	def create_batch(self, batch, parent=None):
+	def create_batch(self, batch, parent=None, sway=False):
+		"""Add the grass to batch. If sway is True, parent must be a
+		GrassSwayGroup."""
 		self.load_resources()
 		grassgroup = pyglet.sprite.SpriteGroup(self.textures['grass'], GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA, parent=parent)
 
@@ -77,27 +105,164 @@ class GrassStrip(ResourceTracker):
 
 		grass_vertices = pad_coord_list(grass_vertices, 2)
 		grass_texcoords = pad_coord_list(grass_texcoords, 2)
-
-		self.list = batch.add(len(grass_vertices) / 2, GL_TRIANGLE_STRIP, grassgroup, ('v2f/stream', grass_vertices), ('t2f/static', grass_texcoords))
+		n = len(grass_vertices) / 2
+
+		self.rest_vertices = array('f', grass_vertices)
+		xs = [v.x for v in self.polyline]
+		us = [x / 128.0 * 0.5 for x in xs]
+		self.xs = array('f', xs)
+		self.sin_u = array('f', [math.sin(u) for u in us])
+		self.cos_u = array('f', [math.cos(u) for u in us])
+		ys = [v.y for v in self.polyline]
+		l = min(xs) - self.SWAY
+		b = min(ys) - 5
+		self.bounds = Rect(l, b, max(xs) + self.SWAY - l, max(ys) + grass.height - 5 - b)
+
+		if sway:
+			# the roots move a little against the tips
+			sways = pad_coord_list([-0.2, 1.0] * len(self.xs), 1)
+			self.list = batch.add(n, GL_TRIANGLE_STRIP, grassgroup, ('v2f/static', grass_vertices), ('t2f/static', grass_texcoords), ('%dg1f/%s' % (shaders.SWAY_ATTRIBUTE, shaders.GENERIC_USAGE), sways))
+			self.swaying = True
+		else:
+			self.list = batch.add(n, GL_TRIANGLE_STRIP, grassgroup, ('v2f/stream', grass_vertices), ('t2f/static', grass_texcoords))
 
 	def update(self, wind_phase):
 		"""Update the sway of the grass"""
-		for i, v in enumerate(self.polyline):
-			dx = 4 * math.sin(wind_phase + v.x / 128.0 * 0.5) + 3 * math.sin(wind_phase * 0.375 + v.x / 128.0 * 0.5)
-			self.grass_list.vertices[i * 4] = v.x + dx * -0.2
-			self.grass_list.vertices[i * 4 + 2] = v.x + dx
+		if self.swaying or wind_phase == self.wind_phase:
+			return
+		self.wind_phase = wind_phase
+		c = 4 * math.cos(wind_phase) + 3 * math.cos(wind_phase * 0.375)
+		s = 4 * math.sin(wind_phase) + 3 * math.sin(wind_phase * 0.375)
+
+		vertices = array('f', self.rest_vertices)
+		sin_u = self.sin_u
+		cos_u = self.cos_u
+		# vertex 0 and the last are padding; the roots are at 4i + 2 and
+		# the tips at 4i + 4
+		j = 2
+		for i, x in enumerate(self.xs):
+			dx = sin_u[i] * c + cos_u[i] * s
+			vertices[j] = x - dx * 0.2
+			vertices[j + 2] = x + dx
+			j += 4
+		vertices[0] = vertices[2]
+		vertices[-2] = vertices[-4]
+		self.list.vertices[:] = vertices
+
+
+def clip_to_slab(vertices, l, r):
+	"""Clip a convex polygon, a list of (x, y) tuples, to the vertical slab
+	l <= x <= r. Returns the clipped polygon, which may be empty."""
+	for edge, inside in [(l, lambda x: x >= l), (r, lambda x: x <= r)]:
+		out = []
+		n = len(vertices)
+		for i in range(n):
+			x1, y1 = vertices[i - 1]
+			x2, y2 = vertices[i]
+			if inside(x2):
+				if not inside(x1):
+					out.append((edge, y1 + (y2 - y1) * float(edge - x1) / (x2 - x1)))
+				out.append((x2, y2))
+			elif inside(x1):
+				out.append((edge, y1 + (y2 - y1) * float(edge - x1) / (x2 - x1)))
+		vertices = out
+	return vertices
+
+
+def weld_triangles(coords, precision=1e-3):
+	"""Weld a flat list of triangle coordinates into an indexed mesh.
+
+	Vertices closer together than precision are merged. Returns a flat list
+	of the distinct vertices' coordinates, and a list of indices, three per
+	triangle. Triangles that collapse when welded are dropped.
+
+	"""
+	vertices = []
+	indices = []
+	index = {}
+	scale = 1.0 / precision
+	for i in range(0, len(coords), 6):
+		tri = []
+		for j in range(i, i + 6, 2):
+			x = coords[j]
+			y = coords[j + 1]
+			key = (int(round(x * scale)), int(round(y * scale)))
+			try:
+				k = index[key]
+			except KeyError:
+				k = index[key] = len(vertices) // 2
+				vertices += [x, y]
+			tri.append(k)
+		if tri[0] != tri[1] and tri[1] != tri[2] and tri[0] != tri[2]:
+			indices.extend(tri)
+	return vertices, indices
+
+
+class TerrainChunk(object):
+	"""The terrain and grass in one vertical slice of the level.
+
+	Each chunk has batches of its own, so that only chunks on screen are
+	drawn. bounds covers everything in the chunk, which may overhang the
+	slice a little.
+
+	"""
+	def __init__(self):
+		self.batch = pyglet.graphics.Batch()
+		self.grass_batch = pyglet.graphics.Batch()
+		self.bounds = None
+
+	def include(self, l, b, r, t):
+		"""Extend the bounds of the chunk to include the given rectangle"""
+		if self.bounds is not None:
+			l = min(l, self.bounds.l)
+			b = min(b, self.bounds.b)
+			r = max(r, self.bounds.r)
+			t = max(t, self.bounds.t)
+		self.bounds = Rect(l, b, r - l, t - b)
 
 
 class TerrainRenderer(ResourceTracker):
+	CHUNK_WIDTH = 1024
+
 	def __init__(self, terrain):
 		self.terrain = terrain
 		self.wind_phase = 0
+		self.chunks = []
 		self.grow_grass()
 
+	def chunk_index(self, x):
+		return int(x // self.CHUNK_WIDTH)
+
+	def split_polyline(self, polyline):
+		"""Split a PolyLine at the chunk boundaries it crosses"""
+		pieces = []
+		piece = []
+		prev = None
+		for v in polyline:
+			if prev is not None:
+				a = self.chunk_index(prev.x)
+				b = self.chunk_index(v.x)
+				# the boundaries between the chunks, in the order crossed
+				if b > a:
+					boundaries = range(a + 1, b + 1)
+				else:
+					boundaries = range(a, b, -1)
+				for i in boundaries:
+					x = i * self.CHUNK_WIDTH
+					p = prev + (v - prev) * (float(x - prev.x) / (v.x - prev.x))
+					piece.append(p)
+					pieces.append(PolyLine(piece))
+					piece = [p]
+			piece.append(v)
+			prev = v
+		if len(piece) > 1:
+			pieces.append(PolyLine(piece))
+		return [pl for pl in pieces if len(pl.vertices) > 1]
+
 	def grow_grass(self):
-		# find polylines where all segments face the up vector
-		polylines = self.terrain.polygon.polylines_facing(Vec2(0, -1), 0.3)
-		self.grass_strips = [GrassStrip(pl) for pl in polylines]
+		self.grass_strips = []
+		for pl in self.terrain.get_grass_polylines():
+			self.grass_strips.extend(GrassStrip(piece) for piece in self.split_polyline(pl))
 
 	@classmethod
 	def on_class_load(cls):
@@ -105,39 +270,83 @@ class TerrainRenderer(ResourceTracker):
 		cls.load_texture('earth-colour', 'earth-colour.png')
 
 	def create_batch(self):
+		"""Build the chunks' batches. Triangles are cut at the chunk
+		boundaries, as grass strips already are by grow_grass(), and the
+		ground in each chunk is welded into one indexed triangle list."""
 		self.load_resources()
 		layer1 = pyglet.graphics.OrderedGroup(1)
 		layer2 = pyglet.graphics.OrderedGroup(2)
 		earthgroup = TerrainGroup(self.textures['earth-colour'], self.textures['earth'], parent=layer1)
-		
-		batch = pyglet.graphics.Batch()
 
+		chunks = {}
+		def get_chunk(x):
+			i = self.chunk_index(x)
+			try:
+				return chunks[i]
+			except KeyError:
+				c = chunks[i] = TerrainChunk()
+				return c
+
+		earth_vertices = {}
+		w = self.CHUNK_WIDTH
 		for group in self.terrain.get_render_groups():
-			earth_vertices = []
-
-			mode, vertices = group.gl_vertices()
-			for v in vertices:
-				earth_vertices += [v.x, v.y]
+			for tri in group.triangles():
+				vs = [(v.x, v.y) for v in tri.vertices]
+				xs = [x for x, y in vs]
+				for i in range(self.chunk_index(min(xs)), self.chunk_index(max(xs)) + 1):
+					poly = clip_to_slab(vs, i * w, (i + 1) * w)
+					if len(poly) < 3:
+						continue
+					chunk = get_chunk(i * w)
+					chunk.include(min(x for x, y in poly), min(y for x, y in poly),
+						max(x for x, y in poly), max(y for x, y in poly))
+					l = earth_vertices.setdefault(chunk, [])
+					for j in range(1, len(poly) - 1):
+						for x, y in (poly[0], poly[j], poly[j + 1]):
+							l += [x, y]
+
+		for chunk, coords in earth_vertices.items():
+			vertices, indices = weld_triangles(coords)
+			chunk.batch.add_indexed(len(vertices) / 2, GL_TRIANGLES, earthgroup, indices, ('v2f/static', vertices))
+
+		program = shaders.get_program('grass')
+		if program:
+			grass_parent = GrassSwayGroup(program, self, parent=layer2)
+		else:
+			grass_parent = layer2
+		for strip in self.grass_strips:
+			vs = strip.polyline.vertices
+			chunk = get_chunk((vs[0].x + vs[-1].x) * 0.5)
+			strip.create_batch(chunk.grass_batch, grass_parent, sway=program is not None)
+			bounds = strip.bounds
+			chunk.include(bounds.l, bounds.b, bounds.r, bounds.t)
 
-			if not earth_vertices:
-				continue
+		self.chunks = [chunks[i] for i in sorted(chunks)]
 
-			if mode == GL_TRIANGLE_STRIP:
-				earth_vertices = pad_coord_list(earth_vertices)
-			
-			batch.add(len(earth_vertices) / 2, mode, earthgroup, ('v2f/static', earth_vertices))
-
-		for strip in self.grass_strips:
-			strip.create_batch(batch, layer2)
-		
-		self.batch = batch
+	def visible_chunks(self, viewport=None):
+		"""Return the chunks that intersect viewport, a Rect, or all chunks"""
+		if viewport is None:
+			return self.chunks
+		return [c for c in self.chunks if c.bounds.intersects(viewport)]
 
 	def update(self):
 		"""Update the grass animation"""
 		self.wind_phase += 0.08
 
-	def draw(self):
-		self.batch.draw()
+	def update_grass(self, viewport):
+		"""Sway the grass strips that are within viewport, a Rect"""
+		for strip in self.grass_strips:
+			if strip.bounds and strip.bounds.intersects(viewport):
+				strip.update(self.wind_phase)
+
+	def draw(self, viewport=None):
+		"""Draw the chunks within viewport, a Rect, or the whole terrain"""
+		chunks = self.visible_chunks(viewport)
+		for c in chunks:
+			c.batch.draw()
+		# grass roots overlap the earth, so draw the grass over all chunks' earth
+		for c in chunks:
+			c.grass_batch.draw()
 
 
 class WireframeTerrainRenderer(TerrainRenderer):
@@ -157,6 +366,9 @@ class WireframeTerrainRenderer(TerrainRenderer):
 		
 		self.batch = batch
 
+	def draw(self, viewport=None):
+		self.batch.draw()
+
 class WireframePolyTerrainRenderer(TerrainRenderer):
 	def create_batch(self):
 		layer1 = pyglet.graphics.OrderedGroup(1)
@@ -174,3 +386,6 @@ class WireframePolyTerrainRenderer(TerrainRenderer):
 			batch.add(len(earth_vertices) / 2, GL_LINE_STRIP, layer1, ('v2f/static', earth_vertices))
 		
 		self.batch = batch
+
+	def draw(self, viewport=None):
+		self.batch.draw()
@@ -0,0 +1,110 @@
+import math
+from array import array
+
+from bamboo.renderers.shaders import ShaderGroup
+
+
+class TreeWobble(object):
+	"""Computes the wobbling trunks and foliage of many BambooTrees in one pass.
+
+	The trunk vertices and leaf quads of every tree drawn are computed from
+	the trees' cached nodes (see BambooTree.compute_nodes()) and written
+	into their existing vertex lists in place, so only those lists' ranges of
+	the batch's buffers are marked for upload. Climbers are moved by the
+	trees themselves, in BambooTree.update().
+
+	Trees that sway in a shader are left alone: their vertex lists are
+	static, and the shader computes their wobble from the level time, which
+	is passed to their TreeSwayGroups from time.
+
+	"""
+	def __init__(self):
+		self.time = 0		# the level time to draw swaying trees at
+		self.sway_groups = {}
+
+	def get_sway_group(self, program, tree, parent=None):
+		"""Return the TreeSwayGroup shared by trees like tree.
+
+		pyglet's SpriteGroups only compare equal if their parents are the same
+		object, so trees must share the group instance, not just an equal one.
+		"""
+		key = TreeSwayGroup(program, self, tree.PIECE_HEIGHT, tree.THINNING, parent)
+		return self.sway_groups.setdefault(key, key)
+
+	def update(self, trees):
+		"""Recompute the trunks and leaves of the given trees and write them
+		into their vertex lists."""
+		cos = math.cos
+		sin = math.sin
+		for tree in trees:
+			if tree.swaying:
+				continue
+			xs, ys, cs, ss, widths = tree.get_nodes()
+			da = tree.wobble_angle / tree.height
+
+			out = array('f')
+			extend = out.extend
+			for i in xrange(tree.height + 1):
+				x = xs[i]
+				y = ys[i]
+				w = widths[i]
+				rx = w * cs[i]
+				ry = w * ss[i]
+				if i == 0:
+					extend((x - rx, y - ry))
+				extend((x - rx, y - ry, x + rx, y + ry))
+			extend(out[-2:])
+			tree.vertex_list.vertices[:] = out
+
+			# leaves are rotated with the segment they grow from, from
+			# corners that are relative to a point on the side of the trunk
+			for vl, leaves in tree.foliage_lists:
+				out = array('f')
+				extend = out.extend
+				for i, side, x1, y1, x2, y2 in leaves:
+					r = i * da
+					cr = cos(r)
+					sr = sin(r)
+					o = (side - 1) * widths[i]
+					x = xs[i] + o * cs[i]
+					y = ys[i] + o * ss[i]
+					extend((
+						x1 * cr - y1 * sr + x, x1 * sr + y1 * cr + y,
+						x2 * cr - y1 * sr + x, x2 * sr + y1 * cr + y,
+						x2 * cr - y2 * sr + x, x2 * sr + y2 * cr + y,
+						x1 * cr - y2 * sr + x, x1 * sr + y2 * cr + y))
+				vl.vertices[:] = out
+
+
+class TreeSwayGroup(ShaderGroup):
+	"""Draws BambooTrees' static vertices, bent by the wind at a TreeWobble's
+	time in the 'tree' shader program.
+
+	The trees' positions and winds are vertex attributes, so one group serves
+	every tree with the same piece height and thinning; use
+	TreeWobble.get_sway_group() so that their sprite groups can be batched
+	together.
+
+	"""
+	def __init__(self, program, wobble, piece_height, thinning, parent=None):
+		super(TreeSwayGroup, self).__init__(program, parent)
+		self.wobble = wobble
+		self.piece_height = piece_height
+		self.thinning = thinning
+
+	def set_uniforms(self):
+		p = self.program
+		p.set_uniform('piece_height', self.piece_height)
+		p.set_uniform('thinning', self.thinning)
+		p.set_uniform('time', self.wobble.time)
+
+	def __eq__(self, ano):
+		return (self.__class__ is ano.__class__ and
+			self.program is ano.program and
+			self.wobble is ano.wobble and
+			self.piece_height == ano.piece_height and
+			self.thinning == ano.thinning and
+			self.parent is ano.parent)
+
+	def __hash__(self):
+		return hash((id(self.program), id(self.wobble), self.piece_height, self.thinning, id(self.parent)))
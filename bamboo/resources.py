@@ -1,6 +1,105 @@
+import time
+from collections import OrderedDict
+
 import pyglet
 
 
+RESOURCE_PATH = ['resources/sprites', 'resources/textures', 'resources/music', 'resources/sounds', 'resources/levels']
+
+
+def init_resources():
+	"""Point pyglet's resource loader at the game's resource directories"""
+	pyglet.resource.path = RESOURCE_PATH[:]
+	pyglet.resource.reindex()
+
+
+_atlas = None
+
+def load_atlas(packed=None):
+	"""Load the sprite atlas.
+
+	packed is what SpriteAtlas.read() returned, if the atlas has already been
+	read (see bamboo.preloader.ResourcePreloader).
+	"""
+	global _atlas
+	from bamboo.atlas import SpriteAtlas, AtlasError
+	_atlas = SpriteAtlas()
+	try:
+		if packed is None:
+			packed = _atlas.read()
+		_atlas.upload(*packed)
+	except (IOError, OSError, AtlasError), e:
+		print "Couldn't pack the sprite atlas, loading sprites separately: %s" % e
+
+
+def atlas_loaded():
+	return _atlas is not None
+
+
+def get_image(name):
+	"""Load a sprite image by resource name.
+
+	Images under resources/sprites come from the sprite atlas (see
+	bamboo.atlas), which is loaded on first use; others are uploaded from
+	what was decoded ahead, or loaded by pyglet.
+	"""
+	if _atlas is None:
+		load_atlas()
+	try:
+		return _atlas.image(name)
+	except KeyError:
+		im = _decoded.pop(('image', name), None)
+		if im is None:
+			return pyglet.resource.image(name)
+		return im.get_texture()
+
+
+# Images and sounds decoded ahead of being loaded, by (kind, resource name)
+_decoded = {}
+
+
+def decode(kind, name):
+	"""Decode an image, texture or sound without touching GL, so that it can
+	be done on a worker thread. The result is used by the next load of it."""
+	if kind == 'sound':
+		result = pyglet.resource.media(name, streaming=False)
+	else:
+		f = pyglet.resource.file(name)
+		try:
+			result = pyglet.image.load(name, file=f)
+		finally:
+			f.close()
+	_decoded[kind, name] = result
+
+
+def get_texture(name):
+	"""Load a texture by resource name, uploading it if it was decoded ahead"""
+	im = _decoded.pop(('texture', name), None)
+	if im is None:
+		return pyglet.resource.texture(name)
+	return im.get_texture()
+
+
+def get_sound(name):
+	"""Load a static sound by resource name"""
+	sound = _decoded.pop(('sound', name), None)
+	if sound is None:
+		return pyglet.resource.media(name, streaming=False)
+	return sound
+
+
+# While listing resources rather than loading them, a list of (kind, name)
+_listing = None
+
+def listed(kind, name):
+	"""If resources are being listed rather than loaded, add this one to the
+	list and return True."""
+	if _listing is None:
+		return False
+	_listing.append((kind, name))
+	return True
+
+
 def set_anchor(tex, anchor_x, anchor_y):
 	"""Sets the anchor point for the texture, but accepts a special value
 	'center' to center the texture in that direction.
@@ -75,7 +174,9 @@ class ResourceTracker(object):
 		assert name not in cls.textures
 		if resource is None:
 			resource = cls.__name__.lower() + '-' + name + '.png'
-		im = pyglet.resource.texture(resource)
+		if listed('texture', resource):
+			return
+		im = get_texture(resource)
 		set_anchor(im, anchor_x, anchor_y)
 		cls.textures[name] = im
 		return im
@@ -85,7 +186,9 @@ class ResourceTracker(object):
 		assert name not in cls.graphics
 		if resource is None:
 			resource = cls.__name__.lower() + '-' + name + '.png'
-		im = pyglet.resource.image(resource)
+		if listed('image', resource):
+			return
+		im = get_image(resource)
 		set_anchor(im, anchor_x, anchor_y)
 		cls.graphics[name] = im
 
@@ -95,7 +198,9 @@ class ResourceTracker(object):
 		assert name + '-r' not in cls.graphics
 		if resource is None:
 			resource = cls.__name__.lower() + '-' + name + '.png'
-		im = pyglet.resource.image(resource)
+		if listed('image', resource):
+			return
+		im = get_image(resource)
 		set_anchor(im, anchor_x, anchor_y)
 		cls.graphics[name + '-r'] = im
 		cls.graphics[name + '-l'] = im.get_transform(flip_x=True)
@@ -105,7 +210,9 @@ class ResourceTracker(object):
 		assert name not in cls.sounds
 		if resource is None:
 			resource = cls.__name__.lower() + '-' + name + '.wav'
-		cls.sounds[name] = pyglet.resource.media(resource, streaming=False)
+		if listed('sound', resource):
+			return
+		cls.sounds[name] = get_sound(resource)
 
 	@classmethod
 	def load_animation(cls, name, resource, frames, anchor_x='center', anchor_y=0, framerate=0.1):
@@ -113,7 +220,11 @@ class ResourceTracker(object):
 		assert name + '-r' not in cls.graphics
 		if resource is None:
 			resource = cls.__name__.lower() + '-' + name + '%d.png'
-		frame_textures = [pyglet.resource.image(resource % (i + 1)) for i in range(frames)]
+		if _listing is not None:
+			for i in range(frames):
+				listed('image', resource % (i + 1))
+			return
+		frame_textures = [get_image(resource % (i + 1)) for i in range(frames)]
 		for f in frame_textures:
 			set_anchor(f, anchor_x, anchor_y)
 		anim = pyglet.image.Animation.from_image_sequence(frame_textures, framerate)
@@ -133,16 +244,92 @@ class ResourceTracker(object):
 
 	@classmethod
 	def load_resources(cls):
-		if cls._resources_loaded:
-			return
+		"""Load the resources of this class and its superclasses, if they
+		are not loaded already."""
+		for c in reversed(cls.__mro__):
+			if 'on_class_load' in c.__dict__ and not c.__dict__.get('_resources_loaded'):
+				c.on_class_load()
+				c._resources_loaded = True
 
+	@classmethod
+	def list_resources(cls):
+		"""Return the resources that on_class_load() would load for this
+		class (but not its superclasses), as a list of (kind, name) where
+		kind is 'image', 'texture' or 'sound'."""
+		global _listing
+		_listing = []
 		try:
-			loader = cls.on_class_load
-		except AttributeError:
-			pass
-		else:
-			loader()
+			if 'on_class_load' in cls.__dict__:
+				cls.on_class_load()
+		finally:
+			found = _listing
+			_listing = None
+		return found
+
+	@classmethod
+	def unload_resources(cls):
+		"""Forget the resources loaded by this class (but not its superclasses).
+
+		Anything still holding one of them keeps it alive; the rest are freed
+		once they are garbage collected. They are loaded again on next use.
+		"""
+		dict.clear(cls.graphics)
+		dict.clear(cls.sounds)
+		dict.clear(cls.textures)
+		cls._resources_loaded = False
+
+	@classmethod
+	def acquire_resources(cls):
+		"""Load the resources of the class, and keep them loaded until
+		release_resources() is called as many times."""
+		for c in resource_classes(cls):
+			_refcounts[c] = _refcounts.get(c, 0) + 1
+			_idle.pop(c, None)
+		cls.load_resources()
+
+	@classmethod
+	def release_resources(cls):
+		"""Drop a reference taken by acquire_resources(). Resources no longer
+		in use are unloaded by collect_resources() after a grace period."""
+		now = time.time()
+		for c in resource_classes(cls):
+			n = _refcounts[c] - 1
+			if n:
+				_refcounts[c] = n
+			else:
+				del _refcounts[c]
+				_idle[c] = now
+
+
+def resource_classes(cls):
+	"""Return cls and its superclasses that load resources of their own"""
+	return [c for c in cls.__mro__ if 'on_class_load' in c.__dict__ and c is not ResourceTracker]
 
-		cls._resources_loaded = True
 
-	# TODO: unload resources
+# Classes whose resources are acquired, and how many times
+_refcounts = {}
+
+# Classes whose resources are loaded but no longer acquired, least recently
+# used first, with the time they were released
+_idle = OrderedDict()
+
+GRACE_PERIOD = 60.0	# seconds that unused resources stay loaded
+MAX_IDLE = 16		# at most this many classes' unused resources stay loaded
+
+
+def collect_resources(now=None):
+	"""Unload the resources of classes that have not been used for
+	GRACE_PERIOD seconds, or beyond the MAX_IDLE most recently used.
+
+	Levels come and go, so this lets the resources of actors that were left
+	behind be freed, while those that will be spawned again soon, such as
+	when restarting a level, stay loaded.
+	"""
+	if now is None:
+		now = time.time()
+	while _idle:
+		cls, released = next(_idle.iteritems())
+		if now - released < GRACE_PERIOD and len(_idle) <= MAX_IDLE:
+			break
+		del _idle[cls]
+		cls.unload_resources()
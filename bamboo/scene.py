@@ -5,7 +5,10 @@ from pyglet import gl
 
 from bamboo.resources import ResourceTracker
 from bamboo.geom import Rect
+from bamboo.timing import timed
 from bamboo.renderers.terrainrenderer import *
+from bamboo.renderers.particlerenderer import ParticleRenderer
+from bamboo.renderers.treerenderer import TreeWobble
 
 
 class Viewport(object):
@@ -85,8 +88,20 @@ class NearBackground(object):
 		gl.glPopMatrix()
 
 
+class CullStats(object):
+	"""Counters for the most recent culling pass, for profiling"""
+	def __init__(self):
+		self.drawn = 0		# actors on screen
+		self.culled = 0		# actors skipped because they are off screen
+
+	def __repr__(self):
+		return 'CullStats(drawn=%d, culled=%d)' % (self.drawn, self.culled)
+
+
 class Scene(object):
 	"""Used to manage rendering for a level"""
+	CULL_MARGIN = 512	# no actor draws further than this from where it is indexed
+
 	def __init__(self, window, level):
 		from bamboo.camera import FixedCamera
 		self.window = window
@@ -99,22 +114,63 @@ class Scene(object):
 		self.terrain_renderer = TerrainRenderer(level.ground) 
 		self.terrain_renderer.create_batch()
 		self.trees_batch = pyglet.graphics.Batch()
+		self.tree_wobble = TreeWobble()
+		self.shown = set()	# actors drawn in the last update
+		self.cull_stats = CullStats()
 		self.batch = pyglet.graphics.Batch()
+		self.particle_renderer = ParticleRenderer(level.particle_systems, self.batch)
 
-	def update(self):
-		from bamboo.actors.trees import BambooTree
-		view_rect = self.camera.get_viewport().bounds()
-		ts = 0
-		for a in self.level.get_actors():
-			if isinstance(a, BambooTree):
-				if a.cull_bounds().intersects(view_rect):
-					a.update_batch(self.trees_batch)
-					ts += 1
-			else:
-				a.update_batch(self.batch)
+	def save_state(self):
+		"""Record the state to interpolate from; call before a logic update"""
+		self.camera.save_state()
 
+	def step(self):
+		"""Advance the camera and scene animations by one logic update"""
+		self.camera.update()
 		self.terrain_renderer.update()
 
+	def update(self, alpha=1.0):
+		"""Update the batches for drawing, with actors interpolated by alpha
+		between their previous and current positions.
+
+		Actors off screen are hidden and otherwise skipped.
+		"""
+		from bamboo.actors.trees import BambooTree
+		view_rect = self.camera.get_viewport(alpha).bounds()
+
+		shown = set()
+		trees = []
+		with timed('scene.sprites'):
+			for a in self.level.actors_in_rect(view_rect, margin=self.CULL_MARGIN):
+				if not a.cull_bounds().intersects(view_rect):
+					continue
+				shown.add(a)
+				# also shows pooled actors that were respawned while on screen
+				a.show()
+				if isinstance(a, BambooTree):
+					# trunks are computed together once their vertex lists exist
+					if a.batch is None:
+						a.update_batch(self.trees_batch, wobble=self.tree_wobble)
+					else:
+						trees.append(a)
+				else:
+					a.update_batch(self.batch, alpha)
+			for a in self.shown - shown:
+				a.hide()
+		self.shown = shown
+		self.cull_stats.drawn = len(shown)
+		self.cull_stats.culled = len(self.level.actors) - len(shown)
+
+		with timed('scene.trees'):
+			self.tree_wobble.time = self.level.time
+			self.tree_wobble.update(trees)
+
+		with timed('scene.grass'):
+			self.terrain_renderer.update_grass(view_rect)
+
+		with timed('scene.particles'):
+			self.particle_renderer.update(alpha)
+
 	def draw_bboxes(self):
 		gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_LINE)
 		vs = []
@@ -130,28 +186,33 @@ class Scene(object):
 	def draw_sprites(self):
 		self.batch.draw()	
 
-	def draw_terrain(self):
-		self.terrain_renderer.draw()
+	def draw_terrain(self, viewport):
+		self.terrain_renderer.draw(viewport.bounds())
 
-	def draw(self):
-		viewport = self.camera.get_viewport()
+	def draw(self, alpha=1.0):
+		viewport = self.camera.get_viewport(alpha)
 
 		# this is good for a night mode
 		#gl.glClear(gl.GL_COLOR_BUFFER_BIT)
 		# draw infinite background
-		self.background.draw()
+		with timed('draw.background'):
+			self.background.draw()
 
 		# set up matrix for viewport
 		viewport.apply_transform()
 
 		# draw parallax backgrounds
-		self.background3.draw(viewport)
-		self.background2.draw(viewport)
+		with timed('draw.background'):
+			self.background3.draw(viewport)
+			self.background2.draw(viewport)
 
 		# TODO: compute PVS
-		self.draw_trees()
-		self.draw_sprites()
-		self.draw_terrain()
+		with timed('draw.trees'):
+			self.draw_trees()
+		with timed('draw.sprites'):
+			self.draw_sprites()
+		with timed('draw.terrain'):
+			self.draw_terrain(viewport)
 
 		# for testing
 		#self.draw_bboxes()
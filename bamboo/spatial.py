@@ -0,0 +1,142 @@
+import math
+
+
+class SpatialGrid(object):
+	"""A uniform grid of buckets that indexes objects by their extents.
+
+	Each object is stored in every cell its extents (l, b, r, t) overlap; a
+	point is simply an extent with no size. Queries return the candidates
+	stored in the cells they touch, so callers should still apply an exact
+	test to the results.
+
+	If cell_h is None the grid is a single row of x buckets, which suits
+	side-scrolling levels where everything is at a similar height.
+
+	"""
+	def __init__(self, cell_w=256, cell_h=None):
+		self.cell_w = float(cell_w)
+		self.cell_h = cell_h and float(cell_h)
+		self.cells = {}
+		self.spans = {}
+
+	def __len__(self):
+		return len(self.spans)
+
+	def __contains__(self, obj):
+		return obj in self.spans
+
+	def span(self, l, b, r, t):
+		"""Compute the range of cells (c0, r0, c1, r1) covering an extent."""
+		cw = self.cell_w
+		ch = self.cell_h
+		if ch is None:
+			return int(math.floor(l / cw)), 0, int(math.floor(r / cw)), 0
+		return int(math.floor(l / cw)), int(math.floor(b / ch)), int(math.floor(r / cw)), int(math.floor(t / ch))
+
+	def span_cells(self, span):
+		c0, r0, c1, r1 = span
+		for cx in range(c0, c1 + 1):
+			for cy in range(r0, r1 + 1):
+				yield cx, cy
+
+	def move(self, obj, l, b, r, t):
+		"""Insert obj with the given extents, or update its extents if it is
+		already in the grid. This is cheap if obj stays in the same cells."""
+		span = self.span(l, b, r, t)
+		old = self.spans.get(obj)
+		if span == old:
+			return
+		if old is not None:
+			self.unlink(obj, old)
+		self.spans[obj] = span
+		cells = self.cells
+		for k in self.span_cells(span):
+			try:
+				cells[k].append(obj)
+			except KeyError:
+				cells[k] = [obj]
+
+	def remove(self, obj):
+		try:
+			span = self.spans.pop(obj)
+		except KeyError:
+			return
+		self.unlink(obj, span)
+
+	def unlink(self, obj, span):
+		cells = self.cells
+		for k in self.span_cells(span):
+			bucket = cells[k]
+			bucket.remove(obj)
+			if not bucket:
+				del cells[k]
+
+	def clear(self):
+		self.cells = {}
+		self.spans = {}
+
+	def query(self, l, b, r, t):
+		"""Generate each object stored in the cells overlapping an extent."""
+		cells = self.cells
+		seen = set()
+		for k in self.span_cells(self.span(l, b, r, t)):
+			for obj in cells.get(k, ()):
+				if obj not in seen:
+					seen.add(obj)
+					yield obj
+
+	def query_rect(self, rect):
+		return self.query(rect.l, rect.b, rect.r, rect.t)
+
+	def query_radius(self, pos, radius):
+		return self.query(pos.x - radius, pos.y - radius, pos.x + radius, pos.y + radius)
+
+	def nearest(self, pos, distance, max_distance=None, margin=0, filter=None):
+		"""Find the object nearest to pos, returning (obj, distance).
+
+		distance is a function giving the distance from pos to an object.
+		The search visits columns of cells in order of increasing x distance,
+		and stops once no unvisited column can hold anything nearer; this
+		requires that distance(obj) is never less than the x distance from
+		pos to the object's extents, minus margin.
+
+		"""
+		if not self.cells:
+			return None, None
+		cols = [k[0] for k in self.cells]
+		rows = [k[1] for k in self.cells]
+		lo = min(cols)
+		hi = max(cols)
+		rows = range(min(rows), max(rows) + 1)
+		cw = self.cell_w
+		c = int(math.floor(pos.x / cw))
+		edge = pos.x - c * cw	# offset of pos into its column
+
+		nearest = None
+		best = None
+		seen = set()
+		ring = 0
+		while c - ring >= lo or c + ring <= hi:
+			# the nearest any object in this ring of columns can be
+			if ring:
+				bound = (ring - 1) * cw + min(edge, cw - edge) - margin
+				if best is not None and bound > best:
+					break
+				if max_distance is not None and bound > max_distance:
+					break
+			for cx in set([c - ring, c + ring]):
+				for cy in rows:
+					for obj in self.cells.get((cx, cy), ()):
+						if obj in seen:
+							continue
+						seen.add(obj)
+						if filter is not None and not filter(obj):
+							continue
+						d = distance(obj)
+						if max_distance is not None and d > max_distance:
+							continue
+						if best is None or d < best:
+							nearest = obj
+							best = d
+			ring += 1
+		return nearest, best
@@ -0,0 +1,87 @@
+"""Measures how long the game takes to start.
+
+run_game.py imports this first, so times are from the start of the script.
+Phases of startup are recorded with mark(); with --startup-profile, imports
+are timed too (see ImportTimer) and everything is reported once the game
+is ready. The time to start each level is also reported (see
+BambooWarriorGameState.start_level()).
+
+"""
+import sys
+import time
+import __builtin__
+
+
+start = time.time()
+marks = []
+profiling = False
+import_timer = None
+
+
+def mark(name):
+	"""Record that a phase of startup has finished"""
+	marks.append((name, time.time()))
+
+
+class ImportTimer(object):
+	"""Times the first import of each module, by wrapping __import__.
+
+	For each module both the total time is kept, including the modules it
+	imports, and the time spent in the module itself.
+	"""
+	def __init__(self):
+		self.times = {}
+		self.stack = []
+		self.original = None
+
+	def install(self):
+		self.original = __builtin__.__import__
+		__builtin__.__import__ = self.__import__
+
+	def uninstall(self):
+		__builtin__.__import__ = self.original
+
+	def __import__(self, name, globals=None, locals=None, fromlist=None, level=-1):
+		if name in sys.modules:
+			return self.original(name, globals, locals, fromlist, level)
+		begin = time.time()
+		self.stack.append(0.0)
+		try:
+			return self.original(name, globals, locals, fromlist, level)
+		finally:
+			children = self.stack.pop()
+			elapsed = time.time() - begin
+			if self.stack:
+				self.stack[-1] += elapsed
+			total, own = self.times.get(name, (0.0, 0.0))
+			self.times[name] = (total + elapsed, own + elapsed - children)
+
+	def report(self, count=15):
+		print "Slowest imports (total/own):"
+		for name, (total, own) in sorted(self.times.items(), key=lambda t: -t[1][1])[:count]:
+			print "  %-36s %6.1fms %6.1fms" % (name, total * 1000, own * 1000)
+
+
+def enable():
+	"""Time imports from now on, and report when startup is finished"""
+	global profiling, import_timer
+	profiling = True
+	import_timer = ImportTimer()
+	import_timer.install()
+
+
+def finished():
+	"""Called when the game is ready to play"""
+	mark('ready')
+	if profiling:
+		report()
+
+
+def report():
+	"""Print the time to each phase of startup, and the slowest imports"""
+	if import_timer is not None:
+		import_timer.uninstall()
+		import_timer.report()
+	print "Startup:"
+	for name, t in marks:
+		print "  %-36s %6.1fms" % (name, (t - start) * 1000)
@@ -1,24 +1,184 @@
 import itertools
+from bisect import bisect_right
+
 from bamboo.geom import Vec2
 
 
+UP = Vec2(0, 1)
+
+
 class Terrain(object):
-	def __init__(self, polygon):
-		"""Create the terrain from a polygon"""
+	# How far an actor may sink below a surface and still be considered to be
+	# standing on it, rather than on the surface beneath
+	STEP_HEIGHT = 20
+
+	# How far below the lowest point of the terrain the void lies. Where
+	# there is no ground at all, eg. between islands, the ground is reported
+	# at the void height, and actors that fall that far are killed.
+	VOID_DEPTH = 1000
+
+	# How closely an edge must face upwards for grass to grow on it
+	GRASS_THRESHOLD = 0.3
+
+	def __init__(self, polygon, tesselator='glu'):
+		"""Create the terrain from a polygon.
+
+		tesselator is the engine passed to Polygon.tesselate().
+		"""
 		self.polygon = polygon
-		self.render_groups = self.polygon.tesselate()
+		self.tesselator = tesselator
+		self.render_groups = None
+		self.grass_polylines = None
+		ys = [v.y for c in polygon.contours for v in c]
+		self.void_height = (min(ys) if ys else 0) - self.VOID_DEPTH
+		self.build_surface_table()
 
 	def get_render_groups(self):
+		"""Return the polygon tesselated into triangle groups.
+
+		This is done on first use, so that game logic can run on a terrain
+		that is never rendered.
+		"""
+		if self.render_groups is None:
+			self.render_groups = self.polygon.tesselate(self.tesselator)
 		return self.render_groups
 
+	def get_grass_polylines(self):
+		"""Return the PolyLines along the top of the terrain where grass grows"""
+		if self.grass_polylines is None:
+			# The level polygon is mirrored on load, so edge normals point inwards
+			self.grass_polylines = self.polygon.polylines_facing(Vec2(0, -1), self.GRASS_THRESHOLD)
+		return self.grass_polylines
+
 	def get_collision_shapes(self):
-		return itertools.chain.from_iterable(g.triangles() for g in self.render_groups)
+		return itertools.chain.from_iterable(g.triangles() for g in self.get_render_groups())
+
+	def surface_segments(self):
+		"""Generate the upward-facing edges of the polygon as tuples of
+		(x1, x2, y1, slope, normal), with x1 < x2."""
+		# The level polygon is mirrored on load, so edge normals point inwards
+		for pl in self.polygon.polylines_facing(Vec2(0, -1)):
+			for seg in pl.segments():
+				x1, y1 = seg.p1
+				x2, y2 = seg.p2
+				if x1 == x2:
+					continue
+				if x1 > x2:
+					x1, y1, x2, y2 = x2, y2, x1, y1
+				slope = float(y2 - y1) / (x2 - x1)
+				yield x1, x2, y1, slope, Vec2(-slope, 1).normalized()
+
+	def build_surface_table(self):
+		"""Index the surface of the terrain by x coordinate.
+
+		The x axis is cut into slabs at every surface vertex. Within a slab
+		every surface is a single straight segment, so a query is a bisect
+		to find the slab and an interpolation along the segment. Each slab
+		holds its surfaces as (x1, y1, slope, normal) tuples, lowest first;
+		there is more than one where islands overhang each other.
+
+		"""
+		segments = list(self.surface_segments())
+		xs = sorted(set(itertools.chain.from_iterable(s[:2] for s in segments)))
+
+		# slab i covers xs[i - 1] <= x < xs[i]; the first and last slabs
+		# extend to infinity
+		slabs = [[] for i in range(len(xs) + 1)]
+		for x1, x2, y1, slope, normal in segments:
+			surface = (x1, y1, slope, normal)
+			for i in range(bisect_right(xs, x1), bisect_right(xs, x2)):
+				slabs[i].append(surface)
+
+		for i in range(1, len(xs)):
+			mid = (xs[i - 1] + xs[i]) * 0.5
+			slabs[i].sort(key=lambda s: s[1] + s[2] * (mid - s[0]))
+
+		if xs:
+			# Outside the polygon, continue the terrain flat
+			slabs[0] = [(xs[0], y1 + slope * (xs[0] - x1), 0, UP) for x1, y1, slope, normal in slabs[1]]
+			slabs[-1] = [(xs[-1], y1 + slope * (xs[-1] - x1), 0, UP) for x1, y1, slope, normal in slabs[-2]]
+
+		self.surface_xs = xs
+		self.surface_slabs = [tuple(s) for s in slabs]
+
+	def select_surface(self, surfaces, x, y):
+		"""Choose which of the overlapping surfaces in a slab supports (x, y).
+
+		This is the highest surface not above y (allowing STEP_HEIGHT), or the
+		lowest surface if y is below all of them. If y is None, return the
+		highest surface.
+		"""
+		if y is None:
+			return surfaces[-1]
+		y += self.STEP_HEIGHT
+		for s in reversed(surfaces):
+			x1, y1, slope, normal = s
+			if y1 + slope * (x - x1) <= y:
+				return s
+		return surfaces[0]
+
+	def surface_at(self, x, y=None):
+		"""Return the surface that supports a point at (x, y), as a tuple
+		(x1, y1, slope, normal), or None if there is no ground at x."""
+		surfaces = self.surface_slabs[bisect_right(self.surface_xs, x)]
+		if not surfaces:
+			return None
+		if len(surfaces) == 1:
+			return surfaces[0]
+		return self.select_surface(surfaces, x, y)
+
+	def ground_at(self, x, y=None):
+		"""Return the height and normal of the ground at x, as a tuple."""
+		s = self.surface_at(x, y)
+		if s is None:
+			return self.void_height, UP
+		x1, y1, slope, normal = s
+		return y1 + slope * (x - x1), normal
+
+	def height_at(self, x, y=None):
+		s = self.surface_at(x, y)
+		if s is None:
+			return self.void_height
+		x1, y1, slope, normal = s
+		return y1 + slope * (x - x1)
+
+	def normal_at(self, x, y=None):
+		s = self.surface_at(x, y)
+		if s is None:
+			return UP
+		return s[3]
+
+	def grounds_at(self, xs, ys=None):
+		"""Return a list of (height, normal) tuples for many points at once.
+
+		This is equivalent to calling ground_at() for each x (and y), but
+		avoids the per-call overhead when updating many actors.
+		"""
+		if ys is None:
+			ys = itertools.repeat(None)
+		slab_xs = self.surface_xs
+		slabs = self.surface_slabs
+		void = (self.void_height, UP)
+		bisect = bisect_right
+		grounds = []
+		append = grounds.append
+		for x, y in itertools.izip(xs, ys):
+			surfaces = slabs[bisect(slab_xs, x)]
+			if not surfaces:
+				append(void)
+				continue
+			if len(surfaces) == 1:
+				x1, y1, slope, normal = surfaces[0]
+			else:
+				x1, y1, slope, normal = self.select_surface(surfaces, x, y)
+			append((y1 + slope * (x - x1), normal))
+		return grounds
 
-	def height_at(self, x):
-		return 60
+	def heights_at(self, xs, ys=None):
+		return [h for h, n in self.grounds_at(xs, ys)]
 
-	def normal_at(self, x):
-		return Vec2(0, 1)
+	def normals_at(self, xs, ys=None):
+		return [n for h, n in self.grounds_at(xs, ys)]
 
 	def update(self):
 		pass
@@ -0,0 +1,158 @@
+"""Named timers for the subsystems that run each frame.
+
+Code to be timed is wrapped in a scope named after the subsystem:
+
+	with timing.timed('level.update'):
+		...
+
+Times are summed over each frame, since some subsystems run several times a
+frame (or not at all), and end_frame() records the totals. Each timer keeps
+the last WINDOW frames, for percentiles of recent play (see
+bamboo.hud.TimingOverlay), and a histogram of the whole run, for the CSV
+written by write_csv().
+
+"""
+import csv
+import math
+import time
+from array import array
+
+
+WINDOW = 300		# frames of recent history kept (10 seconds at 30fps)
+
+# Buckets of the whole-run histograms start at BUCKET_MIN seconds and each
+# is BUCKET_RATIO times wider than the last, so percentiles of the whole run
+# are overestimated by at most 10%
+BUCKET_MIN = 1e-5
+BUCKET_RATIO = 1.1
+BUCKETS = 160
+
+LOG_RATIO = math.log(BUCKET_RATIO)
+
+
+def bucket(t):
+	"""Return the index of the histogram bucket for a time of t seconds"""
+	if t <= BUCKET_MIN:
+		return 0
+	return min(BUCKETS - 1, int(math.log(t / BUCKET_MIN) / LOG_RATIO) + 1)
+
+
+class Timer(object):
+	"""The time taken by one subsystem in each frame"""
+	def __init__(self, name):
+		self.name = name
+		self.current = 0.0	# time so far in this frame
+		self.recent = array('d', [0.0]) * WINDOW
+		self.frames = 0
+		self.total = 0.0
+		self.max = 0.0
+		self.histogram = array('l', [0]) * BUCKETS
+
+	def end_frame(self):
+		t = self.current
+		self.current = 0.0
+		self.recent[self.frames % WINDOW] = t
+		self.frames += 1
+		self.total += t
+		if t > self.max:
+			self.max = t
+		self.histogram[bucket(t)] += 1
+
+	def mean(self):
+		if not self.frames:
+			return 0.0
+		return self.total / self.frames
+
+	def recent_percentiles(self, ps):
+		"""Return percentiles of the last WINDOW frames; ps are fractions"""
+		n = min(self.frames, WINDOW)
+		if not n:
+			return [0.0] * len(ps)
+		ts = sorted(self.recent[:n])
+		return [ts[min(n - 1, int(p * n))] for p in ps]
+
+	def percentiles(self, ps):
+		"""Return percentiles of the whole run, from the histogram"""
+		result = []
+		for p in ps:
+			target = p * self.frames
+			count = 0
+			for i, c in enumerate(self.histogram):
+				count += c
+				if count > target:
+					break
+			result.append(min(BUCKET_MIN * BUCKET_RATIO ** i, self.max))
+		return result
+
+
+class Scope(object):
+	"""Adds the time spent in a with block to a timer. Scopes with the same
+	name must not be nested."""
+	__slots__ = ['timer', 'start']
+
+	def __init__(self, timer):
+		self.timer = timer
+
+	def __enter__(self):
+		self.start = time.time()
+
+	def __exit__(self, *exc_info):
+		self.timer.current += time.time() - self.start
+
+
+class Timers(object):
+	"""All the timers, in the order they were first used.
+
+	The 'frame' timer is the time from one end_frame() to the next.
+	"""
+	def __init__(self):
+		self.timers = []
+		self.scopes = {}
+		self.frame = self.get('frame')
+		self.last_frame = None
+
+	def get(self, name):
+		try:
+			return self.scopes[name].timer
+		except KeyError:
+			t = Timer(name)
+			self.timers.append(t)
+			self.scopes[name] = Scope(t)
+			return t
+
+	def timed(self, name):
+		"""Return a scope that times a with block as part of the named timer"""
+		try:
+			return self.scopes[name]
+		except KeyError:
+			self.get(name)
+			return self.scopes[name]
+
+	def end_frame(self):
+		"""Record this frame's time for each timer; call once per frame"""
+		now = time.time()
+		if self.last_frame is not None:
+			self.frame.current = now - self.last_frame
+			for t in self.timers:
+				t.end_frame()
+		else:
+			for t in self.timers:
+				t.current = 0.0
+		self.last_frame = now
+
+	def write_csv(self, filename):
+		"""Write the whole-run statistics of each timer, in milliseconds"""
+		f = open(filename, 'wb')
+		try:
+			w = csv.writer(f)
+			w.writerow(['name', 'frames', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'])
+			for t in self.timers:
+				ms = [t.mean()] + t.percentiles([0.5, 0.9, 0.99]) + [t.max]
+				w.writerow([t.name, t.frames] + ['%.3f' % (v * 1000) for v in ms])
+		finally:
+			f.close()
+
+
+timers = Timers()
+timed = timers.timed
+end_frame = timers.end_frame
@@ -4,6 +4,7 @@
 
 A PyWeek 10 game by Daniel Pope"""
 
+from bamboo import startup
 from optparse import OptionParser
 
 parser = OptionParser()
@@ -13,9 +14,35 @@ parser.add_option('-p', '--profiler', action='store_true', help='Run with profil
 parser.add_option('-r', '--showfps', action='store_true', help='Show framerate display', default=False)
 parser.add_option('-l', '--level', action='store', help='Start a named level')
 parser.add_option('-n', '--novbo', action='store_true', help='Disable the use of VBOs (buggy/slow on some drivers)', default=False)
+parser.add_option('--noshaders', action='store_true', help='Animate trees and grass on the CPU rather than in shaders', default=False)
+parser.add_option('--headless', action='store_true', help='Simulate a level without a window, as fast as possible, and report the frame rate', default=False)
+parser.add_option('--frames', action='store', type='int', help='Number of frames to simulate in headless mode', default=1000)
+parser.add_option('--timings', action='store', help='Write the time taken by each subsystem per frame to this CSV file on exit (F3 shows them in game)')
+parser.add_option('--startup-profile', action='store_true', help='Time imports and each phase of startup, printed when the game is ready, and the start of each level', default=False)
 
 options, arguments = parser.parse_args()
 
+if options.startup_profile:
+	startup.enable()
+
+if options.headless:
+	# don't let pyglet open a hidden window when GL is imported
+	import pyglet
+	pyglet.options['shadow_window'] = False
+
+	from bamboo.headless import HeadlessSimulation
+	sim = HeadlessSimulation((options.level or 'level1') + '.svg')
+	if options.profiler:
+		import cProfile
+		cProfile.run('elapsed = sim.run(options.frames)', 'profiler-stats.dat')
+		import pstats
+		p = pstats.Stats('profiler-stats.dat')
+		p.sort_stats('time').print_stats()
+	else:
+		elapsed = sim.run(options.frames)
+	sim.report(options.frames, elapsed)
+	raise SystemExit
+
 if options.novbo:
 	# monkey-patch pyglet
 	from pyglet.graphics import vertexdomain
@@ -25,18 +52,30 @@ if options.novbo:
 		return attribute, usage, False
 	vertexdomain.create_attribute_usage = create_attribute_usage
 
+if options.noshaders:
+	from bamboo.renderers import shaders
+	shaders.enabled = False
+
 from bamboo.game import Game
+from bamboo.gamestate import LoadingGameState
 
+startup.mark('imports')
 game = Game(options)
+startup.mark('window')
 
+# the first gamestate is created once its level has loaded
 if options.level:
-	from bamboo.gamestate import BambooWarriorGameState
-	state = BambooWarriorGameState(game, [options.level + '.svg'])
-	game.set_gamestate(state)
+	level = options.level + '.svg'
+	def create(preloader):
+		from bamboo.gamestate import BambooWarriorGameState
+		return BambooWarriorGameState(game, [level], preloader=preloader)
 else:
-	from bamboo.menu import MenuGameState
-	state = MenuGameState(game)
-	game.set_gamestate(state)
+	level = 'title.svg'
+	def create(preloader):
+		from bamboo.gamestate import StaticLevelGameState
+		from bamboo.menu import MenuGameState
+		return MenuGameState(game, child=StaticLevelGameState(game, preloader=preloader))
+game.set_gamestate(LoadingGameState(game, level, create))
 
 if options.profiler:
 	import cProfile
@@ -0,0 +1,21 @@
+"""Tests for Bamboo Warrior. Run them from the game directory with:
+
+  python -m unittest discover tests
+
+"""
+import os
+
+import pyglet
+
+# the tests don't open windows; GL tests make their own context (see glcontext)
+pyglet.options['shadow_window'] = False
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def init_resources():
+	"""Point pyglet's resource loader at the game's resources. pyglet
+	finds relative paths from the script, which here is unittest's."""
+	from bamboo.resources import RESOURCE_PATH
+	pyglet.resource.path = [os.path.join(ROOT, p) for p in RESOURCE_PATH]
+	pyglet.resource.reindex()
@@ -0,0 +1,131 @@
+"""An offscreen GL context for tests that need one.
+
+There is often no display to open a window on, so the context is created
+with EGL on Mesa's surfaceless platform and drawn into a framebuffer
+object. Set LIBGL_ALWAYS_SOFTWARE=1 to use Mesa's software rasteriser.
+pyglet doesn't know about EGL, so the context is given to pyglet as a bare
+pyglet.gl.base.Context; pyglet's GL functions dispatch to whichever
+context is current through libglvnd.
+
+"""
+import ctypes
+import unittest
+
+import pyglet
+from pyglet import gl
+from pyglet.gl.base import Context
+
+
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+EGL_RENDERABLE_TYPE = 0x3040
+EGL_OPENGL_BIT = 0x0008
+EGL_SURFACE_TYPE = 0x3033
+EGL_NONE = 0x3038
+EGL_OPENGL_API = 0x30A2
+
+
+class GLContextError(Exception):
+	"""An offscreen context could not be created"""
+
+
+_context = None
+
+def create_context():
+	"""Create an offscreen GL context and make it current for pyglet"""
+	global _context
+	if _context is not None:
+		return _context
+	try:
+		egl = ctypes.CDLL('libEGL.so.1')
+	except OSError, e:
+		raise GLContextError("No EGL: %s" % e)
+	egl.eglGetProcAddress.restype = ctypes.c_void_p
+	egl.eglGetProcAddress.argtypes = [ctypes.c_char_p]
+	egl.eglCreateContext.restype = ctypes.c_void_p
+	get_platform_display = egl.eglGetProcAddress('eglGetPlatformDisplayEXT')
+	if not get_platform_display:
+		raise GLContextError("No eglGetPlatformDisplayEXT")
+	get_platform_display = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p)(get_platform_display)
+
+	display = ctypes.c_void_p(get_platform_display(EGL_PLATFORM_SURFACELESS_MESA, None, None))
+	if not display.value or not egl.eglInitialize(display, None, None):
+		raise GLContextError("Couldn't initialise a surfaceless EGL display")
+	if not egl.eglBindAPI(EGL_OPENGL_API):
+		raise GLContextError("EGL doesn't support desktop GL")
+	attributes = (ctypes.c_int * 5)(EGL_RENDERABLE_TYPE, EGL_OPENGL_BIT, EGL_SURFACE_TYPE, 0, EGL_NONE)
+	config = ctypes.c_void_p()
+	count = ctypes.c_int()
+	if not egl.eglChooseConfig(display, attributes, ctypes.byref(config), 1, ctypes.byref(count)) or not count.value:
+		raise GLContextError("No EGL config for a surfaceless GL context")
+	context = egl.eglCreateContext(display, config, None, None)
+	if not context or not egl.eglMakeCurrent(display, None, None, ctypes.c_void_p(context)):
+		raise GLContextError("Couldn't create an EGL context")
+
+	_context = Context(None)
+	_context.canvas = True	# set_current() requires one
+	_context.set_current()
+	return _context
+
+
+def require_context():
+	"""Create the context, or skip the test if that is not possible"""
+	try:
+		create_context()
+	except GLContextError, e:
+		raise unittest.SkipTest(str(e))
+
+
+class Framebuffer(object):
+	"""An RGBA framebuffer object of width x height to draw into"""
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.id = gl.GLuint()
+		gl.glGenFramebuffers(1, ctypes.byref(self.id))
+		self.colour = gl.GLuint()
+		gl.glGenRenderbuffers(1, ctypes.byref(self.colour))
+		gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.colour)
+		gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+		gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.id)
+		gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, self.colour)
+		status = gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER)
+		if status != gl.GL_FRAMEBUFFER_COMPLETE:
+			raise GLContextError("Framebuffer incomplete: 0x%x" % status)
+		gl.glViewport(0, 0, width, height)
+
+	def draw(self, batch, rect):
+		"""Clear the framebuffer, draw batch with rect filling it, and
+		return the pixels as a string of RGBA bytes."""
+		gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.id)
+		gl.glClearColor(0, 0, 0, 0)
+		gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+		gl.glMatrixMode(gl.GL_PROJECTION)
+		gl.glLoadIdentity()
+		gl.glOrtho(rect.l, rect.r, rect.b, rect.t, -1, 1)
+		gl.glMatrixMode(gl.GL_MODELVIEW)
+		gl.glLoadIdentity()
+		batch.draw()
+		gl.glFinish()
+		pixels = ctypes.create_string_buffer(self.width * self.height * 4)
+		gl.glReadPixels(0, 0, self.width, self.height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+		return pixels.raw
+
+	def delete(self):
+		gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+		gl.glDeleteRenderbuffers(1, ctypes.byref(self.colour))
+		gl.glDeleteFramebuffers(1, ctypes.byref(self.id))
+
+
+def difference(a, b):
+	"""Return the fraction of pixels that differ noticeably between two
+	drawings, and the fraction drawn on in either."""
+	differ = drawn = 0
+	for i in xrange(0, len(a), 4):
+		pa = bytearray(a[i:i + 4])
+		pb = bytearray(b[i:i + 4])
+		if pa[3] or pb[3]:
+			drawn += 1
+			if max(abs(x - y) for x, y in zip(pa, pb)) > 32:
+				differ += 1
+	n = len(a) / 4.0
+	return differ / n, drawn / n
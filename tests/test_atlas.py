@@ -0,0 +1,141 @@
+"""Tests for packing the sprite atlas, and for its cache."""
+import os
+import glob
+import random
+import shutil
+import tempfile
+import unittest
+
+from tests import ROOT
+from bamboo import atlas
+from bamboo.atlas import SpriteAtlas, AtlasError, pack, place, ATLAS_SIZE, PADDING
+
+
+class PackTest(unittest.TestCase):
+	def check_packing(self, sizes, size=ATLAS_SIZE, padding=PADDING):
+		positions, heights = pack(sizes, size, padding)
+		self.assertEqual(sorted(positions), sorted(sizes))
+		rects = {}
+		for name, (i, x, y) in positions.items():
+			w, h = sizes[name]
+			r = (x, y, x + w + padding, y + h + padding)
+			self.assertTrue(x >= 0 and y >= 0, "%s is at (%d, %d)" % (name, x, y))
+			self.assertTrue(r[2] <= size and r[3] <= heights[i] <= size,
+				"%s overflows atlas %d" % (name, i))
+			rects.setdefault(i, []).append((r, name))
+		for i, rs in rects.items():
+			for j, (a, aname) in enumerate(rs):
+				for b, bname in rs[j + 1:]:
+					overlap = a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+					self.assertFalse(overlap, "%s overlaps %s in atlas %d" % (aname, bname, i))
+		return positions, heights
+
+	def test_random(self):
+		rand = random.Random(0)
+		for trial in range(20):
+			sizes = {}
+			for n in range(rand.randint(1, 200)):
+				sizes['sprite%d.png' % n] = (rand.randint(1, 300), rand.randint(1, 300))
+			self.check_packing(sizes)
+
+	def test_sprites(self):
+		sizes = {}
+		for f in glob.glob(os.path.join(ROOT, atlas.SPRITE_DIR, '*.png')):
+			sizes[os.path.basename(f)] = atlas.png_size(f)
+		self.check_packing(sizes)
+
+	def test_full(self):
+		# images that only fit one to an atlas
+		sizes = dict(('big%d.png' % n, (ATLAS_SIZE - PADDING, 600)) for n in range(3))
+		positions, heights = self.check_packing(sizes)
+		self.assertEqual(sorted(i for i, x, y in positions.values()), [0, 1, 2])
+
+	def test_too_large(self):
+		self.assertRaises(AtlasError, pack, {'huge.png': (ATLAS_SIZE, 10)})
+		self.assertRaises(AtlasError, pack, {'huge.png': (10, ATLAS_SIZE - PADDING + 1)})
+		self.check_packing({'exact.png': (ATLAS_SIZE - PADDING, ATLAS_SIZE - PADDING)})
+
+	def test_place(self):
+		shelves = []
+		self.assertEqual(place(shelves, 60, 40, 100), (0, 0))
+		self.assertEqual(place(shelves, 40, 30, 100), (60, 0))
+		self.assertEqual(place(shelves, 10, 30, 100), (0, 40))
+		self.assertEqual(place(shelves, 100, 31, 100), None)
+		self.assertEqual(place(shelves, 100, 30, 100), (0, 70))
+
+
+class CacheTest(unittest.TestCase):
+	SPRITES = ['bamboo-leaf1.png', 'bamboo-leaf2.png', 'life-icon.png', 'blood-spray-1.png']
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.sprite_dir = os.path.join(self.dir, 'sprites')
+		self.cache_dir = os.path.join(self.dir, 'cache')
+		os.mkdir(self.sprite_dir)
+		for name in self.SPRITES:
+			shutil.copy(os.path.join(ROOT, atlas.SPRITE_DIR, name), self.sprite_dir)
+		self.builds = 0
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def atlas(self):
+		a = SpriteAtlas(self.sprite_dir, self.cache_dir)
+		build = a.build
+
+		def counted(files):
+			self.builds += 1
+			return build(files)
+		a.build = counted
+		return a
+
+	def key(self):
+		a = self.atlas()
+		return a.key(a.sprite_files())
+
+	def test_cached(self):
+		packed = self.atlas().read()
+		self.assertEqual(self.builds, 1)
+		self.assertEqual(sorted(packed[1]), sorted(self.SPRITES))
+		self.assertEqual(self.atlas().read(), packed)
+		self.assertEqual(self.builds, 1)
+
+	def test_truncated(self):
+		packed = self.atlas().read()
+		a = self.atlas()
+		fname = a.atlas_filename(self.key(), 0)
+		data = open(fname, 'rb').read()
+		for length in (len(data) // 2, 0):
+			f = open(fname, 'wb')
+			f.write(data[:length])
+			f.close()
+			self.assertRaises(AtlasError, a.read_cache, self.key())
+			self.assertEqual(self.atlas().read(), packed)
+		self.assertEqual(self.builds, 3)
+
+	def test_corrupt_index(self):
+		packed = self.atlas().read()
+		f = open(self.atlas().index_filename(self.key()), 'w')
+		f.write('atlas\t0\tbad\n')
+		f.close()
+		self.assertRaises(AtlasError, self.atlas().read_cache, self.key())
+		self.assertEqual(self.atlas().read(), packed)
+		self.assertEqual(self.builds, 2)
+
+	def test_missing(self):
+		self.atlas().read()
+		os.remove(self.atlas().atlas_filename(self.key(), 0))
+		self.atlas().read()
+		self.assertEqual(self.builds, 2)
+
+	def test_stale(self):
+		self.atlas().read()
+		old = set(self.atlas().cached_files())
+		os.remove(os.path.join(self.sprite_dir, self.SPRITES[0]))
+		atlases, index = self.atlas().read()
+		self.assertEqual(self.builds, 2)
+		self.assertEqual(sorted(index), sorted(self.SPRITES[1:]))
+		# the cache of the old sprites is replaced
+		self.assertFalse(old.intersection(self.atlas().cached_files()))
+		self.atlas().read()
+		self.assertEqual(self.builds, 2)
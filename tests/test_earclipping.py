@@ -0,0 +1,153 @@
+"""Check the ear clipping tesselator against the polygons it tesselates.
+
+Random points are tested against the triangles and against the polygon
+itself, by the odd winding rule. Where there is a GL context (see
+glcontext), the triangles are also compared with GLU's.
+
+"""
+import random
+import unittest
+
+from tests import init_resources
+from tests.glcontext import require_context
+
+
+LEVELS = ['arena', 'level1', 'level2', 'level3', 'level4', 'sky-islands', 'title']
+
+
+def inside(polygon, x, y):
+	"""Return True if (x, y) is inside the polygon by the odd winding rule"""
+	result = False
+	for c in polygon.contours:
+		j = c[-1]
+		for i in c:
+			if (i.y > y) != (j.y > y) and x < i.x + (y - i.y) * (j.x - i.x) / (j.y - i.y):
+				result = not result
+			j = i
+	return result
+
+
+def coverage(triangles, x, y):
+	"""Count the triangles that (x, y) is strictly inside"""
+	n = 0
+	for (ax, ay), (bx, by), (cx, cy) in triangles:
+		d1 = (bx - ax) * (y - ay) - (by - ay) * (x - ax)
+		d2 = (cx - bx) * (y - by) - (cy - by) * (x - bx)
+		d3 = (ax - cx) * (y - cy) - (ay - cy) * (x - cx)
+		if (d1 > 0 and d2 > 0 and d3 > 0) or (d1 < 0 and d2 < 0 and d3 < 0):
+			n += 1
+	return n
+
+
+def triangles(groups):
+	"""List the triangles of some triangle groups as tuples of vertices"""
+	return [tuple(t.vertices) for g in groups for t in g.triangles()]
+
+
+def random_points(polygon, count, seed=0):
+	"""Generate random points within the bounds of the polygon"""
+	vs = [v for c in polygon.contours for v in c]
+	l = min(v.x for v in vs) - 10
+	r = max(v.x for v in vs) + 10
+	b = min(v.y for v in vs) - 10
+	t = max(v.y for v in vs) + 10
+	rand = random.Random(seed)
+	for i in xrange(count):
+		yield rand.uniform(l, r), rand.uniform(b, t)
+
+
+def load_polygon(name):
+	from bamboo.levelloader import SVGLevelLoader
+	init_resources()
+	level = SVGLevelLoader(cache=False, tesselator='earclip').load(name + '.svg')
+	return level.ground.polygon
+
+
+def polygon(*contours):
+	from bamboo.geom import Polygon, Vec2
+	p = Polygon()
+	for c in contours:
+		p.add_contour([Vec2(x, y) for x, y in c])
+	return p
+
+
+class EarClippingTest(unittest.TestCase):
+	POINTS = 1000
+
+	def tesselate(self, polygon):
+		return triangles(polygon.tesselate('earclip'))
+
+	def assertCovers(self, polygon, points=POINTS):
+		"""Check that the triangles cover every point inside the polygon
+		exactly once, and no point outside it"""
+		tris = self.tesselate(polygon)
+		for x, y in random_points(polygon, points):
+			expected = 1 if inside(polygon, x, y) else 0
+			self.assertEqual(coverage(tris, x, y), expected,
+				"(%f, %f) is covered %d times, not %d" % (x, y, coverage(tris, x, y), expected))
+		return tris
+
+	def test_levels(self):
+		for name in LEVELS:
+			self.assertCovers(load_polygon(name))
+
+	def test_hole(self):
+		p = polygon(
+			[(0, 0), (10, 0), (10, 10), (0, 10)],
+			[(3, 3), (7, 3), (7, 7), (3, 7)],
+		)
+		self.assertCovers(p)
+
+	def test_holes_and_islands(self):
+		p = polygon(
+			[(0, 0), (30, 0), (30, 20), (0, 20)],
+			# clockwise and anticlockwise holes
+			[(2, 2), (12, 2), (12, 18), (2, 18)],
+			[(28, 2), (18, 2), (18, 18), (28, 18)],
+			# an island in a hole
+			[(5, 5), (9, 5), (9, 15), (5, 15)],
+		)
+		self.assertCovers(p)
+
+	def test_self_intersecting(self):
+		bowtie = polygon([(0, 0), (10, 10), (10, 0), (0, 10)])
+		self.assertCovers(bowtie)
+
+		# under the odd winding rule the middle of a pentagram is outside,
+		# leaving five points that touch at the crossings
+		star = polygon([(0, 10), (6, -8), (-9.5, 3), (9.5, 3), (-6, -8)])
+		self.assertCovers(star)
+
+	def test_hole_touching_outline(self):
+		# The hole touches the outline at (0, 0), on an edge running up to
+		# (0, 5), where the outline touches itself. The bridge must be made
+		# to a vertex straight above the hole.
+		p = polygon(
+			[(0, -10), (0, 5), (10, 0), (10, 8), (0, 5), (0, 10), (-20, 10), (-20, -10)],
+			[(-10, -5), (0, 0), (-10, 5)],
+		)
+		self.assertCovers(p)
+
+	def test_degenerate(self):
+		self.assertEqual(self.tesselate(polygon([(0, 0), (5, 5), (10, 10)])), [])
+		self.assertEqual(self.tesselate(polygon([(0, 0), (10, 0)])), [])
+		# repeated vertices, and one closing the contour, are dropped
+		p = polygon([(0, 0), (0, 0), (10, 0), (10, 10), (0, 10), (0, 0)])
+		self.assertEqual(len(self.assertCovers(p)), 2)
+
+
+class GLUComparisonTest(unittest.TestCase):
+	POINTS = 1000
+
+	@classmethod
+	def setUpClass(cls):
+		require_context()
+
+	def test_levels(self):
+		for name in LEVELS:
+			p = load_polygon(name)
+			glu = triangles(p.tesselate('glu'))
+			earclip = triangles(p.tesselate('earclip'))
+			for x, y in random_points(p, self.POINTS, seed=1):
+				self.assertEqual(coverage(earclip, x, y), coverage(glu, x, y),
+					"%s: GLU and ear clipping differ at (%f, %f)" % (name, x, y))
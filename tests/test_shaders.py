@@ -0,0 +1,110 @@
+"""Check that trees and grass drawn by the shaders match the CPU path.
+
+This needs an offscreen GL context (see glcontext); to check the shaders
+under Mesa's software rasteriser, run with LIBGL_ALWAYS_SOFTWARE=1.
+
+"""
+import copy
+import random
+import unittest
+
+import pyglet
+
+from tests import init_resources
+from tests.glcontext import require_context, Framebuffer, difference
+
+
+class ShaderTest(unittest.TestCase):
+	SIZE = 256
+	STEPS = 37	# logic updates to run, so that the trees are bent
+
+	@classmethod
+	def setUpClass(cls):
+		require_context()
+		from bamboo.levelloader import SVGLevelLoader
+		init_resources()
+		cls.level = SVGLevelLoader(cache=False).load('level1.svg')
+		cls.level.restart()
+		for i in range(cls.STEPS):
+			cls.level.update()
+
+	def setUp(self):
+		self.fbo = Framebuffer(self.SIZE, self.SIZE)
+
+	def tearDown(self):
+		self.fbo.delete()
+
+	def test_programs_link(self):
+		from bamboo.renderers import shaders
+		for name in shaders.PROGRAMS:
+			self.assertTrue(shaders.ShaderProgram(*shaders.PROGRAMS[name]).id)
+
+	def draw_tree(self, tree, wobble=None):
+		"""Draw a copy of tree, with the same leaves each time"""
+		tree = copy.copy(tree)
+		tree.batch = None
+		batch = pyglet.graphics.Batch()
+		random.seed(1)
+		tree.update_batch(batch, wobble=wobble)
+		return self.fbo.draw(batch, tree.cull_bounds()), tree
+
+	def check_trees(self, cls):
+		from bamboo.renderers.treerenderer import TreeWobble
+		trees = [a for a in self.level.actors if type(a) is cls][:3]
+		self.assertTrue(trees)
+		for tree in trees:
+			cpu, copied = self.draw_tree(tree)
+			self.assertFalse(copied.swaying)
+
+			wobble = TreeWobble()
+			wobble.time = self.level.time
+			gpu, copied = self.draw_tree(tree, wobble)
+			self.assertTrue(copied.swaying)
+			differ, drawn = difference(cpu, gpu)
+			self.assertTrue(drawn > 0.02, "Tree not drawn")
+			self.assertTrue(differ < 0.01 * drawn, "Shader and CPU trees differ in %.1f%% of pixels" % (differ * 100))
+		return wobble, tree, cpu, drawn
+
+	def test_trees(self):
+		from bamboo.actors.trees import BambooTree
+		wobble, tree, cpu, drawn = self.check_trees(BambooTree)
+
+		# and the shader does move the tree with time
+		wobble.time += 20
+		gpu, copied = self.draw_tree(tree, wobble)
+		differ, drawn = difference(cpu, gpu)
+		self.assertTrue(differ > 0.1 * drawn)
+
+	def test_background_trees(self):
+		from bamboo.actors.trees import BackgroundBambooTree
+		# no level has any, so plant one
+		if not any(type(a) is BackgroundBambooTree for a in self.level.actors):
+			self.level.spawn(BackgroundBambooTree(height=7), 600)
+		self.check_trees(BackgroundBambooTree)
+
+	def test_grass(self):
+		from bamboo.renderers import shaders
+		from bamboo.renderers.terrainrenderer import TerrainRenderer, GrassStrip, GrassSwayGroup
+		renderer = TerrainRenderer(self.level.ground)
+		renderer.wind_phase = 1.3
+		program = shaders.get_program('grass')
+		self.assertTrue(program)
+
+		strips = renderer.grass_strips[:3]
+		self.assertTrue(strips)
+		for strip in strips:
+			cpu_strip = GrassStrip(strip.polyline)
+			batch = pyglet.graphics.Batch()
+			cpu_strip.create_batch(batch)
+			cpu_strip.update(renderer.wind_phase)
+			bounds = cpu_strip.bounds
+			cpu = self.fbo.draw(batch, bounds)
+
+			gpu_strip = GrassStrip(strip.polyline)
+			batch = pyglet.graphics.Batch()
+			gpu_strip.create_batch(batch, GrassSwayGroup(program, renderer), sway=True)
+			gpu = self.fbo.draw(batch, bounds)
+
+			differ, drawn = difference(cpu, gpu)
+			self.assertTrue(drawn > 0.02, "Grass not drawn")
+			self.assertTrue(differ < 0.01 * drawn, "Shader and CPU grass differ in %.1f%% of pixels" % (differ * 100))